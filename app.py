@@ -1,18 +1,50 @@
 import streamlit as st
-from huggingface_hub import InferenceClient
-from dotenv import load_dotenv
-from PIL import Image
 import os
-import io
+import random
+import re
+import threading
+import uuid
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
+
+# Load environment variables once per process, before the modules below read their settings
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+load_environment()
+
+from config import (
+    ASPECT_MAP, CAMERA_STYLES, DETAIL_LEVELS, IMAGE_TO_IMAGE_MODEL, LIGHTING_STYLES,
+    MODEL_CHOICES, REALISM_LEVELS, STYLE_PROMPTS
+)
+from export import build_history_zip, history_file_name
+from gallery import Gallery
+from generation import DRAFT_MAX_SIDE, generation_job, upscale_job
+from imaging import (
+    OUTPUT_FORMAT, OUTPUT_FORMATS, OUTPUT_QUALITY, PNG_COMPRESS_LEVEL, cached_output, output_formats, prepare_reference
+)
+from jobs import DEFAULT_JOBS
+from metrics import METRICS, start_metrics_server
+from assets import page_style
+from previews import preview_size
+from prompts import clean_negative_prompt, enhance_prompt
+from rate_limit import QueueFullError
+from result_cache import create_result_cache
+from retry import CircuitOpenError
+from similarity_cache import SIMILARITY_EMBEDDING_MODEL, SIMILARITY_THRESHOLD, SimilarityIndex
+from singleflight import DEFAULT_FLIGHT
 
 # Configuration
-MODEL_NAME = "black-forest-labs/FLUX.1-schnell"
-IMAGE_TO_IMAGE_MODEL = "stabilityai/stable-diffusion-xl-refiner-1.0"
 HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
+MAX_BATCH_SIZE = 8
+GALLERY_PAGE_SIZE = 8
+# "Download All" exports at most this many of the newest matching images
+GALLERY_EXPORT_MAX_IMAGES = int(os.getenv("GALLERY_EXPORT_MAX_IMAGES", "100"))
+# Show every visitor's images in the gallery instead of only their own
+GALLERY_PUBLIC = os.getenv("GALLERY_PUBLIC", "0") == "1"
 
 # Page configuration
 st.set_page_config(
@@ -22,182 +54,27 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for futuristic styling
-st.markdown("""
-<style>
-    /* Dark futuristic theme */
-    .stApp {
-        background: linear-gradient(135deg, #0a0a0f 0%, #1a1a2e 50%, #0f0f1a 100%);
-    }
-
-    .main-header {
-        background: linear-gradient(90deg, #00f5ff 0%, #bf00ff 50%, #00f5ff 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-size: 3.5rem;
-        font-weight: 900;
-        text-align: center;
-        margin-bottom: 0.5rem;
-        text-shadow: 0 0 30px rgba(0, 245, 255, 0.5);
-        letter-spacing: 2px;
-        animation: glow 2s ease-in-out infinite alternate;
-    }
-
-    @keyframes glow {
-        from { filter: drop-shadow(0 0 20px rgba(0, 245, 255, 0.4)); }
-        to { filter: drop-shadow(0 0 30px rgba(191, 0, 255, 0.6)); }
-    }
-
-    .sub-header {
-        text-align: center;
-        color: #8892b0;
-        margin-bottom: 2rem;
-        font-size: 1.1rem;
-        letter-spacing: 1px;
-    }
-
-    /* Glowing buttons */
-    .stButton>button {
-        width: 100%;
-        border-radius: 12px;
-        height: 3.5rem;
-        font-size: 1.2rem;
-        font-weight: 600;
-        background: linear-gradient(135deg, #00f5ff 0%, #bf00ff 100%);
-        border: none;
-        color: white;
-        text-transform: uppercase;
-        letter-spacing: 2px;
-        transition: all 0.3s ease;
-        box-shadow: 0 0 20px rgba(0, 245, 255, 0.3);
-    }
-
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 0 40px rgba(0, 245, 255, 0.6);
-    }
-
-    /* Glass card effect */
-    .glass-card {
-        background: rgba(255, 255, 255, 0.05);
-        backdrop-filter: blur(10px);
-        border-radius: 20px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        padding: 2rem;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-    }
-
-    /* Neon text */
-    .neon-text {
-        color: #00f5ff;
-        text-shadow: 0 0 10px rgba(0, 245, 255, 0.8);
-    }
-
-    /* Input styling */
-    .stTextArea textarea {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 1px solid rgba(0, 245, 255, 0.3) !important;
-        border-radius: 12px !important;
-        color: #e6e6e6 !important;
-        font-size: 1rem !important;
-    }
-
-    .stTextArea textarea:focus {
-        border-color: #00f5ff !important;
-        box-shadow: 0 0 20px rgba(0, 245, 255, 0.3) !important;
-    }
-
-    /* Select boxes */
-    .stSelectbox > div > div {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 1px solid rgba(0, 245, 255, 0.3) !important;
-        border-radius: 10px !important;
-    }
-
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border-radius: 10px !important;
-        color: #00f5ff !important;
-    }
-
-    /* Sidebar styling */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #0a0a0f 0%, #1a1a2e 100%);
-        border-right: 1px solid rgba(0, 245, 255, 0.2);
-    }
-
-    [data-testid="stSidebar"] .stMarkdown h1,
-    [data-testid="stSidebar"] .stMarkdown h2,
-    [data-testid="stSidebar"] .stMarkdown h3 {
-        color: #00f5ff !important;
-    }
-
-    /* Image container */
-    .image-container {
-        border: 2px solid rgba(0, 245, 255, 0.3);
-        border-radius: 20px;
-        padding: 10px;
-        background: rgba(0, 0, 0, 0.3);
-        box-shadow: 0 0 30px rgba(0, 245, 255, 0.1);
-    }
-
-    /* Radio buttons */
-    .stRadio > div {
-        display: flex;
-        justify-content: center;
-        gap: 1rem;
-    }
-
-    .stRadio label {
-        background: rgba(255, 255, 255, 0.05) !important;
-        padding: 0.8rem 1.5rem !important;
-        border-radius: 25px !important;
-        border: 1px solid rgba(0, 245, 255, 0.3) !important;
-        transition: all 0.3s ease !important;
-    }
-
-    .stRadio label:hover {
-        border-color: #00f5ff !important;
-        box-shadow: 0 0 15px rgba(0, 245, 255, 0.3) !important;
-    }
-
-    /* Center container */
-    .center-container {
-        max-width: 800px;
-        margin: 0 auto;
-        padding: 2rem;
-    }
-
-    /* Success/Error messages */
-    .stSuccess {
-        background: rgba(0, 255, 136, 0.1) !important;
-        border: 1px solid rgba(0, 255, 136, 0.3) !important;
-    }
-
-    .stError {
-        background: rgba(255, 0, 85, 0.1) !important;
-        border: 1px solid rgba(255, 0, 85, 0.3) !important;
-    }
-
-    /* Divider */
-    hr {
-        border-color: rgba(0, 245, 255, 0.2) !important;
-    }
-
-    /* Footer */
-    .footer-text {
-        text-align: center;
-        color: #4a5568;
-        font-size: 0.9rem;
-        margin-top: 3rem;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Initialize session state for image history
-if 'image_history' not in st.session_state:
-    st.session_state.image_history = []
+# Custom CSS for futuristic styling (a cached stylesheet link when static serving is on)
+st.markdown(page_style(st.get_option("server.enableStaticServing")), unsafe_allow_html=True)
+
+# Identifies this session in the shared request queue and owns its gallery
+# images; kept in the URL so a browser refresh stays the same session
+if 'session_id' not in st.session_state:
+    session_id = st.query_params.get("session", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+        session_id = uuid.uuid4().hex
+    st.session_state.session_id = session_id
+if st.query_params.get("session") != st.session_state.session_id:
+    st.query_params["session"] = st.session_state.session_id
+
+# Background generation jobs (re-adopted from the URL after a browser refresh)
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = [
+        job_id for job_id in st.query_params.get("jobs", "").split(",")
+        if DEFAULT_JOBS.get(job_id) is not None
+    ]
+    st.session_state.last_result = None
+    st.session_state.last_error = None
 
 # Title and description
 st.markdown('<h1 class="main-header">AI Image Generator Pro</h1>', unsafe_allow_html=True)
@@ -216,8 +93,57 @@ if not HUGGINGFACE_TOKEN:
     """)
     st.stop()
 
-# Initialize the HuggingFace client
-client = InferenceClient(token=HUGGINGFACE_TOKEN)
+# Initialize the HuggingFace client once per process (per token) so every
+# session reuses the same pooled keep-alive connections. huggingface_hub takes
+# about half a second to import, so this happens after the first page render.
+@st.cache_resource(show_spinner=False)
+def get_client(token):
+    from inference import create_client
+    return create_client(token)
+
+
+# Result cache shared by all sessions of this process
+@st.cache_resource
+def get_result_cache():
+    return create_result_cache()
+
+
+result_cache = get_result_cache()
+
+
+# Near-duplicate prompt index over the result cache, shared by all sessions
+@st.cache_resource
+def get_similarity_index():
+    return SimilarityIndex()
+
+
+similarity_index = get_similarity_index()
+
+
+# Persistent gallery shared by all sessions and restarts
+@st.cache_resource
+def get_gallery():
+    return Gallery()
+
+
+gallery = get_gallery()
+
+
+# Prometheus-style /metrics endpoint, started once per process when METRICS_PORT is set
+@st.cache_resource
+def get_metrics_server(port):
+    return start_metrics_server(port)
+
+
+if os.getenv("METRICS_PORT"):
+    get_metrics_server(int(os.getenv("METRICS_PORT")))
+
+
+# Downscaled reference uploads, reused across reruns
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_reference_image(data):
+    return prepare_reference(data)
+
 
 # Sidebar configuration
 with st.sidebar:
@@ -227,14 +153,17 @@ with st.sidebar:
     st.subheader("Model")
     model_choice = st.selectbox(
         "Text-to-Image Model",
-        ["FLUX.1 Schnell (Fast)", "Stable Diffusion XL"],
+        list(MODEL_CHOICES),
         help="Choose the AI model for generating images"
     )
 
-    if model_choice == "FLUX.1 Schnell (Fast)":
-        MODEL_NAME = "black-forest-labs/FLUX.1-schnell"
-    else:
-        MODEL_NAME = "stabilityai/stable-diffusion-xl-base-1.0"
+    MODEL_NAME = MODEL_CHOICES[model_choice]
+    show_previews = st.checkbox(
+        "Live previews",
+        value=False,
+        help="Show coarse previews while a single text-to-image generation runs "
+             "(costs an extra quick request on backends that cannot stream them)"
+    )
 
     st.markdown("---")
 
@@ -242,18 +171,14 @@ with st.sidebar:
     st.subheader("Image Size")
     aspect_ratio = st.selectbox(
         "Aspect Ratio",
-        ["1:1 (Square)", "16:9 (Landscape)", "9:16 (Portrait)", "4:3 (Standard)", "3:2 (Photo)"]
+        list(ASPECT_MAP)
+    )
+    width, height = ASPECT_MAP[aspect_ratio]
+    draft_mode = st.checkbox(
+        "⚡ Draft mode",
+        value=False,
+        help=f"Generate quick {DRAFT_MAX_SIDE}px drafts; upscale only the ones you keep to {width}x{height}"
     )
-
-    # Map aspect ratios to dimensions
-    aspect_map = {
-        "1:1 (Square)": (1024, 1024),
-        "16:9 (Landscape)": (1344, 768),
-        "9:16 (Portrait)": (768, 1344),
-        "4:3 (Standard)": (1152, 896),
-        "3:2 (Photo)": (1216, 832)
-    }
-    width, height = aspect_map[aspect_ratio]
 
     st.markdown("---")
 
@@ -261,28 +186,56 @@ with st.sidebar:
     st.subheader("Quick Style Presets")
     style_preset = st.selectbox(
         "Apply Style",
-        ["None", "Cinematic", "Anime", "Digital Art", "Oil Painting",
-         "Watercolor", "Sketch", "3D Render", "Vintage Photo", "Neon Cyberpunk",
-         "Fantasy Art", "Minimalist", "Pop Art", "Gothic", "Steampunk"]
+        list(STYLE_PROMPTS)
     )
 
-    style_prompts = {
-        "None": "",
-        "Cinematic": "cinematic lighting, movie still, dramatic atmosphere, film grain",
-        "Anime": "anime style, studio ghibli, vibrant colors, detailed illustration",
-        "Digital Art": "digital art, trending on artstation, highly detailed, sharp focus",
-        "Oil Painting": "oil painting, classical art style, brush strokes visible, museum quality",
-        "Watercolor": "watercolor painting, soft edges, artistic, flowing colors",
-        "Sketch": "pencil sketch, black and white, detailed drawing, artistic",
-        "3D Render": "3D render, octane render, unreal engine 5, highly detailed, realistic",
-        "Vintage Photo": "vintage photograph, 1970s aesthetic, film grain, nostalgic",
-        "Neon Cyberpunk": "cyberpunk, neon lights, futuristic city, blade runner style",
-        "Fantasy Art": "fantasy art, magical, ethereal lighting, epic composition",
-        "Minimalist": "minimalist, clean lines, simple composition, modern design",
-        "Pop Art": "pop art style, bold colors, andy warhol inspired",
-        "Gothic": "gothic art, dark atmosphere, dramatic shadows, mysterious",
-        "Steampunk": "steampunk style, brass and copper, victorian era, mechanical elements"
-    }
+    st.markdown("---")
+
+    # Download encoding
+    st.subheader("Output Format")
+    output_format = st.selectbox(
+        "Download Format",
+        output_formats(),
+        index=output_formats().index(OUTPUT_FORMAT) if OUTPUT_FORMAT in output_formats() else 0,
+        help="PNG is lossless; WebP, JPEG and AVIF are much smaller for photographic images"
+    )
+    _, output_extension, output_mime = OUTPUT_FORMATS[output_format]
+    if output_extension == "png":
+        output_quality = OUTPUT_QUALITY
+        png_compress_level = st.slider(
+            "PNG Compression Level", 0, 9, PNG_COMPRESS_LEVEL,
+            help="Higher levels give smaller files but take longer to encode"
+        )
+    else:
+        png_compress_level = PNG_COMPRESS_LEVEL
+        output_quality = st.slider("Quality", 10, 100, OUTPUT_QUALITY, step=5)
+
+    st.markdown("---")
+
+    # Result cache
+    st.subheader("Cache")
+    use_cache = st.checkbox(
+        "Reuse cached results",
+        value=True,
+        help="Return a stored image when the same request was generated before"
+    )
+    use_similar = st.checkbox(
+        "Reuse near-duplicate prompts",
+        value=os.getenv("SIMILARITY_CACHE", "0") == "1",
+        disabled=not use_cache,
+        help="Also return a stored image when an earlier prompt differs only in wording details "
+             "such as case, spacing or word order (same model, size, style and negative prompt)"
+    )
+    if use_similar and use_cache:
+        similar_threshold = st.slider("Similarity Threshold", 0.80, 1.00, SIMILARITY_THRESHOLD, 0.01)
+        st.caption(f"{len(similarity_index)} prompts indexed ({'embeddings' if SIMILARITY_EMBEDDING_MODEL else 'TF-IDF'})")
+    cache_stats = result_cache.stats()
+    st.caption(
+        f"Hits: {cache_stats['hits']} | Misses: {cache_stats['misses']} | "
+        f"{cache_stats['entries']} images ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)"
+    )
+    flight_stats = DEFAULT_FLIGHT.stats()
+    st.caption(f"Duplicate requests shared: {flight_stats['coalesced']} of {flight_stats['calls'] + flight_stats['coalesced']}")
 
     st.markdown("---")
 
@@ -299,38 +252,127 @@ with st.sidebar:
     """)
 
     st.markdown("---")
-    st.markdown("Built with Streamlit & HuggingFace")
 
-# Build enhanced prompt function
-def enhance_prompt(base_prompt, realism, lighting, detail, camera, style, negative=""):
-    enhancements = []
+    # Performance debug panel
+    if st.checkbox("Show performance metrics", value=False):
+        st.dataframe(get_client(HUGGINGFACE_TOKEN).stats(), hide_index=True, use_container_width=True)
+        st.dataframe(METRICS.summary(), hide_index=True, use_container_width=True)
+        st.json(METRICS.counters(), expanded=False)
 
-    # Add style preset
-    if style != "None":
-        enhancements.append(style_prompts[style])
+    st.markdown("---")
+    st.markdown("Built with Streamlit & HuggingFace")
 
-    if realism == "Photorealistic":
-        enhancements.append("photorealistic, ultra realistic")
-    elif realism == "Hyper-realistic":
-        enhancements.append("hyper-realistic, ultra realistic, lifelike, 8K")
-    elif realism == "Artistic":
-        enhancements.append("artistic interpretation, creative")
+# Show a friendly message for a failed generation
+def show_error(placeholder, error):
+    if isinstance(error, QueueFullError):
+        placeholder.warning("🚦 Too many people are generating right now. Please try again in a moment.")
+        return
+    if isinstance(error, CircuitOpenError):
+        placeholder.warning(f"🔌 The inference service is failing right now. Please try again in {error.retry_after:.0f} seconds.")
+        return
+
+    error_message = str(error)
+
+    if "401" in error_message or "unauthorized" in error_message.lower():
+        placeholder.error("🔑 Authentication Error: Invalid API token.")
+    elif "429" in error_message or "rate" in error_message.lower():
+        placeholder.error("⏳ Rate Limit Reached. Please wait a moment and try again.")
+    elif "503" in error_message or "loading" in error_message.lower():
+        placeholder.warning("🔄 Model is loading... Please try again in a few seconds.")
+    else:
+        placeholder.error(f"❌ Error: {error_message}")
+
+
+# Keep pending job IDs in the URL so a browser refresh can pick them up again
+def sync_job_params():
+    if st.session_state.pending_jobs:
+        st.query_params["jobs"] = ",".join(st.session_state.pending_jobs)
+    elif "jobs" in st.query_params:
+        del st.query_params["jobs"]
+
+
+# Job metadata stored with every gallery entry
+ENTRY_FIELDS = ("model", "final_prompt", "negative_prompt", "draft", "target_width", "target_height")
+
+
+# Refine a kept draft to full size in the background
+def submit_upscale(entry, draft_bytes):
+    st.session_state.last_result = None
+    st.session_state.last_error = None
+    try:
+        job_id = DEFAULT_JOBS.submit(
+            upscale_job, get_client(HUGGINGFACE_TOKEN), draft_bytes, entry["target_width"], entry["target_height"],
+            session_id=st.session_state.session_id,
+            cache=result_cache if use_cache else None,
+            meta={
+                "prompt": entry["prompt"], "style": entry["style"], "model": IMAGE_TO_IMAGE_MODEL,
+                "final_prompt": entry["final_prompt"], "negative_prompt": entry["negative_prompt"]
+            },
+            prompt=entry["final_prompt"] or entry["prompt"],
+            negative_prompt=entry["negative_prompt"] or "",
+            model=IMAGE_TO_IMAGE_MODEL
+        )
+    except QueueFullError as e:
+        st.session_state.last_error = e
+        return
+    st.session_state.pending_jobs.append(job_id)
+    sync_job_params()
+
+
+# Move finished background jobs into the gallery
+def collect_finished_jobs():
+    collected = False
+    for job_id in list(st.session_state.pending_jobs):
+        job = DEFAULT_JOBS.get(job_id)
+        if job is not None and not job.is_finished:
+            continue
+
+        st.session_state.pending_jobs.remove(job_id)
+        DEFAULT_JOBS.discard(job_id)
+        collected = True
+        if job is None:
+            # Expired before anyone collected it
+            continue
+        if job.error is not None:
+            st.session_state.last_error = job.error
+            continue
+
+        image, image_bytes, cache_hit = job.result
+        entry = gallery.add(
+            image_bytes,
+            prompt=job.meta["prompt"],
+            style=job.meta["style"],
+            timestamp=datetime.fromtimestamp(job.finished).strftime("%H:%M:%S"),
+            image=image,
+            session_id=st.session_state.session_id,
+            **{key: job.meta.get(key) for key in ENTRY_FIELDS}
+        )
+        st.session_state.last_result = {"id": entry["id"], "cache_hit": cache_hit}
+
+    if collected:
+        sync_job_params()
+    return collected
 
-    if lighting != "Default":
-        enhancements.append(lighting.lower())
 
-    if detail != "Default":
-        enhancements.append(detail.lower())
+# Poll running jobs without holding the script thread; rerun the page when one finishes
+@st.fragment(run_every=1.0)
+def show_job_progress():
+    if collect_finished_jobs():
+        st.rerun()
 
-    if camera != "Default":
-        enhancements.append(camera.lower())
+    pending = [DEFAULT_JOBS.get(job_id) for job_id in st.session_state.pending_jobs]
+    messages = [job.message for job in pending if job is not None and job.message]
+    count = len(pending)
+    label = "your masterpiece" if count == 1 else f"{count} images"
+    st.info(f"🎨 Creating {label}... This may take a moment." + (f" ({messages[0]})" if messages else ""))
 
-    # Always add quality boosters
-    enhancements.append("masterpiece, best quality")
+    # Latest coarse preview, replaced by the final image on the next full rerun
+    previews = [job.preview for job in pending if job is not None and job.preview]
+    if previews:
+        st.image(previews[0], caption="Preview", use_container_width=True)
 
-    enhanced = f"{base_prompt}, {', '.join(enhancements)}"
 
-    return enhanced
+collect_finished_jobs()
 
 # Centered main content
 col1, main_col, col2 = st.columns([1, 2, 1])
@@ -360,7 +402,7 @@ with main_col:
             key="img2img_uploader"
         )
         if uploaded_file:
-            uploaded_image = uploaded_file.read()
+            uploaded_image = get_reference_image(uploaded_file.getvalue())
             st.image(uploaded_image, caption="Reference Image", use_container_width=True)
 
         strength = st.slider(
@@ -397,28 +439,42 @@ with main_col:
         with col_s1:
             realism_level = st.select_slider(
                 "Realism Level",
-                options=["Artistic", "Balanced", "Photorealistic", "Hyper-realistic"],
+                options=REALISM_LEVELS,
                 value="Balanced"
             )
 
             detail_level = st.selectbox(
                 "Detail Level",
-                ["Default", "Highly detailed", "Intricate details", "8K ultra detailed"]
+                DETAIL_LEVELS
             )
 
         with col_s2:
             lighting = st.selectbox(
                 "Lighting Style",
-                ["Default", "Soft natural light", "Golden hour", "Dramatic lighting",
-                 "Studio lighting", "Cinematic", "Neon glow", "Moonlight"]
+                LIGHTING_STYLES
             )
 
             camera_style = st.selectbox(
                 "Camera Style",
-                ["Default", "DSLR photo", "35mm film", "Portrait lens",
-                 "Wide angle", "Macro shot", "Aerial view", "Bokeh effect"]
+                CAMERA_STYLES
             )
 
+    # Batch generation
+    with st.expander("📦 Batch Mode", expanded=False):
+        batch_mode = st.radio(
+            "Batch mode",
+            ["Off", "Variants", "One image per line"],
+            horizontal=True,
+            help="Variants: several images of the same prompt. One image per line: each prompt line is a separate image."
+        )
+        batch_count = st.slider(
+            "Number of variants",
+            min_value=2,
+            max_value=MAX_BATCH_SIZE,
+            value=4,
+            disabled=batch_mode != "Variants"
+        )
+
     # Generate button
     st.markdown("---")
     generate_btn = st.button("🚀 GENERATE", type="primary", use_container_width=True)
@@ -435,93 +491,156 @@ with main_col:
         elif mode == "Image to Image" and uploaded_image is None:
             status_placeholder.warning("⚠️ Please upload an image first.")
         else:
-            try:
-                # Build enhanced prompt
-                final_prompt = enhance_prompt(
-                    prompt, realism_level, lighting, detail_level,
-                    camera_style, style_preset
-                )
-
-                # Show the enhanced prompt
-                with st.expander("📋 View Enhanced Prompt", expanded=False):
-                    st.code(final_prompt, language=None)
-
-                # Generate image
-                with st.spinner("🎨 Creating your masterpiece... This may take a moment."):
-                    if mode == "Text to Image":
-                        image = client.text_to_image(
-                            prompt=final_prompt,
-                            model=MODEL_NAME,
-                            width=width,
-                            height=height
-                        )
-                    else:
-                        image = client.image_to_image(
-                            image=uploaded_image,
-                            prompt=final_prompt,
-                            model=IMAGE_TO_IMAGE_MODEL,
-                            strength=strength
-                        )
-
-                # Display the generated image
-                status_placeholder.success("✅ Image generated successfully!")
-                image_placeholder.image(image, caption=prompt[:100] + "..." if len(prompt) > 100 else prompt, use_container_width=True)
-
-                # Save to history
-                st.session_state.image_history.insert(0, {
-                    "image": image,
-                    "prompt": prompt,
-                    "style": style_preset,
-                    "timestamp": datetime.now().strftime("%H:%M:%S")
-                })
-
-                # Keep only last 10 images
-                st.session_state.image_history = st.session_state.image_history[:10]
-
-                # Download button
-                img_buffer = io.BytesIO()
-                image.save(img_buffer, format="PNG")
-                img_buffer.seek(0)
-
-                download_placeholder.download_button(
-                    label="📥 Download Image",
-                    data=img_buffer,
-                    file_name=f"ai_generated_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
-                    mime="image/png",
-                    use_container_width=True
-                )
-
-            except Exception as e:
-                error_message = str(e)
-
-                if "401" in error_message or "unauthorized" in error_message.lower():
-                    status_placeholder.error("🔑 Authentication Error: Invalid API token.")
-                elif "429" in error_message or "rate" in error_message.lower():
-                    status_placeholder.error("⏳ Rate Limit Reached. Please wait a moment and try again.")
-                elif "503" in error_message or "loading" in error_message.lower():
-                    status_placeholder.warning("🔄 Model is loading... Please try again in a few seconds.")
+            if batch_mode == "One image per line":
+                base_prompts = [line.strip() for line in prompt.splitlines() if line.strip()][:MAX_BATCH_SIZE]
+            elif batch_mode == "Variants":
+                base_prompts = [prompt] * batch_count
+            else:
+                base_prompts = [prompt]
+
+            # Build enhanced prompts
+            with METRICS.span("enhance_prompt"):
+                final_prompts = [
+                    enhance_prompt(
+                        base_prompt, realism_level, lighting, detail_level,
+                        camera_style, style_preset
+                    )
+                    for base_prompt in base_prompts
+                ]
+
+            # Show the enhanced prompt
+            with st.expander("📋 View Enhanced Prompt", expanded=False):
+                st.code("\n".join(dict.fromkeys(final_prompts)), language=None)
+
+            # Submit one background job per image; results are collected on later reruns
+            st.session_state.last_result = None
+            st.session_state.last_error = None
+            for base_prompt, final_prompt in zip(base_prompts, final_prompts):
+                request = {"prompt": final_prompt, "negative_prompt": clean_negative_prompt(negative_prompt)}
+                meta = {"prompt": base_prompt, "style": style_preset, "final_prompt": final_prompt,
+                        "negative_prompt": request["negative_prompt"]}
+                if mode == "Text to Image" and draft_mode:
+                    # Small draft now; the full size is only spent on drafts that get upscaled
+                    draft_width, draft_height = preview_size(width, height, DRAFT_MAX_SIDE)
+                    request.update(model=MODEL_NAME, width=draft_width, height=draft_height)
+                    meta.update(draft=True, target_width=width, target_height=height)
+                elif mode == "Text to Image":
+                    request.update(model=MODEL_NAME, width=width, height=height)
                 else:
-                    status_placeholder.error(f"❌ Error: {error_message}")
+                    request.update(model=IMAGE_TO_IMAGE_MODEL, reference_image=uploaded_image, strength=strength)
+                if batch_mode == "Variants":
+                    request["seed"] = random.randint(0, 2**31 - 1)
+
+                try:
+                    job_id = DEFAULT_JOBS.submit(
+                        generation_job, get_client(HUGGINGFACE_TOKEN),
+                        session_id=st.session_state.session_id,
+                        cache=result_cache if use_cache else None,
+                        similar=similarity_index if use_cache and use_similar else None,
+                        similar_threshold=similar_threshold if use_cache and use_similar else None,
+                        previews=show_previews and len(base_prompts) == 1 and mode == "Text to Image" and not draft_mode,
+                        meta=dict(meta, model=request["model"]),
+                        **request
+                    )
+                except QueueFullError as e:
+                    # Shown once the jobs already submitted have finished
+                    st.session_state.last_error = e
+                    break
+                st.session_state.pending_jobs.append(job_id)
+
+            sync_job_params()
+
+    if st.session_state.pending_jobs:
+        show_job_progress()
+    elif st.session_state.last_error is not None:
+        show_error(status_placeholder, st.session_state.last_error)
+    elif st.session_state.last_result is not None:
+        # The latest result is read back from the gallery (None once it is cleared or pruned)
+        result_entry = gallery.get(st.session_state.last_result["id"])
+        result_bytes = gallery.image_bytes(result_entry) if result_entry is not None else None
+        if result_bytes is not None:
+            # Display the generated image
+            if st.session_state.last_result["cache_hit"] == "similar":
+                status_placeholder.success("♻️ Reused the image of a near-identical earlier prompt!")
+            elif st.session_state.last_result["cache_hit"]:
+                status_placeholder.success("✅ Image loaded from cache!")
+            else:
+                status_placeholder.success("✅ Image generated successfully!")
+            result_prompt = result_entry["prompt"]
+            image_placeholder.image(result_bytes, caption=result_prompt[:100] + "..." if len(result_prompt) > 100 else result_prompt, use_container_width=True)
+
+            # Download button (encoded once per image and output setting)
+            output_bytes, encode_seconds = cached_output(result_bytes, output_format, output_quality, png_compress_level)
+            download_placeholder.download_button(
+                label="📥 Download Image",
+                data=output_bytes,
+                file_name=f"ai_generated_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{output_extension}",
+                mime=output_mime,
+                use_container_width=True
+            )
+            st.caption(
+                f"{output_format}: {len(output_bytes) / 1024:.0f} KB, encoded in {encode_seconds * 1000:.0f} ms "
+                f"(stored PNG: {len(result_bytes) / 1024:.0f} KB)"
+            )
+            if result_entry.get("draft"):
+                if st.button(f"⬆️ Upscale to {result_entry['target_width']}x{result_entry['target_height']}",
+                             use_container_width=True):
+                    submit_upscale(result_entry, result_bytes)
+                    st.rerun()
 
-# Image History Section
-if st.session_state.image_history:
+# Go back to the first gallery page when the search changes
+def reset_gallery_page():
+    st.session_state.gallery_page = 0
+
+
+# Image History Section (one page of the persistent gallery at a time)
+gallery_session = None if GALLERY_PUBLIC else st.session_state.session_id
+if gallery.count(session_id=gallery_session):
     st.markdown("---")
-    st.markdown('''
+    if GALLERY_PUBLIC:
+        gallery_note = "Public gallery: everyone using this app can see, search and download these images and prompts"
+    else:
+        gallery_note = "Your images: only this page's link shows them"
+    st.markdown(f'''
         <div style="text-align: center; margin-bottom: 1.5rem;">
             <h2 style="color: #00f5ff; text-shadow: 0 0 20px rgba(0, 245, 255, 0.5);
                        font-size: 1.8rem; letter-spacing: 3px; margin: 0;">
                 GENERATION HISTORY
             </h2>
             <p style="color: #8892b0; font-size: 0.9rem; margin-top: 0.5rem;">
-                Your recent creations
+                {gallery_note}
             </p>
         </div>
     ''', unsafe_allow_html=True)
 
+    gallery_query = st.text_input(
+        "Search prompts",
+        placeholder="🔍 Search prompts...",
+        label_visibility="collapsed",
+        key="gallery_query",
+        on_change=reset_gallery_page
+    )
+    if 'gallery_page' not in st.session_state:
+        st.session_state.gallery_page = 0
+    page_total = gallery.count(gallery_query, gallery_session)
+    page_count = max(1, -(-page_total // GALLERY_PAGE_SIZE))
+    # Images may have been removed from another session since the last rerun
+    st.session_state.gallery_page = min(st.session_state.gallery_page, page_count - 1)
+    page_items, page_total = gallery.page(
+        gallery_query, st.session_state.gallery_page * GALLERY_PAGE_SIZE, GALLERY_PAGE_SIZE, gallery_session
+    )
+    if not page_items:
+        st.caption("No images match your search.")
+
     # Create a 4-column grid for history
     history_cols = st.columns(4)
 
-    for idx, item in enumerate(st.session_state.image_history[:8]):
+    for idx, item in enumerate(page_items, start=st.session_state.gallery_page * GALLERY_PAGE_SIZE):
+        # Cards only need the thumbnail; full-size bytes are read on download
+        thumbnail = gallery.thumbnail(item)
+        if thumbnail is None:
+            # Image files removed by another session or replica
+            continue
         with history_cols[idx % 4]:
             # Card container with neon border
             st.markdown(f'''
@@ -541,11 +660,11 @@ if st.session_state.image_history:
                     ">
             ''', unsafe_allow_html=True)
 
-            st.image(item["image"], use_container_width=True)
+            st.image(thumbnail, use_container_width=True)
 
             # Prompt preview (truncated)
             short_prompt = item["prompt"][:40] + "..." if len(item["prompt"]) > 40 else item["prompt"]
-            style_used = item.get("style", "None")
+            style_used = item.get("style", "None") + (" · draft" if item["draft"] else "")
             st.markdown(f'''
                 <p style="
                     color: #a0aec0;
@@ -574,25 +693,53 @@ if st.session_state.image_history:
 
             st.markdown('</div></div>', unsafe_allow_html=True)
 
-            # Download button for history items
-            img_buf = io.BytesIO()
-            item["image"].save(img_buf, format="PNG")
-            img_buf.seek(0)
+            # Download button for history items, encoded only when clicked
             st.download_button(
                 "📥 Download",
-                data=img_buf,
-                file_name=f"ai_generated_{item['timestamp'].replace(':', '-')}_{idx}.png",
-                mime="image/png",
-                key=f"download_{idx}",
+                data=lambda item=item: cached_output(
+                    gallery.image_bytes(item), output_format, output_quality, png_compress_level
+                )[0],
+                file_name=history_file_name(item, idx, output_extension),
+                mime=output_mime,
+                key=f"download_{item['id']}",
                 use_container_width=True
             )
+            if item["draft"] and st.button("⬆️ Upscale", key=f"upscale_{item['id']}", use_container_width=True):
+                draft_bytes = gallery.image_bytes(item)
+                if draft_bytes is not None:
+                    submit_upscale(item, draft_bytes)
+                st.rerun()
 
-    # Clear history button
+    # Page navigation, export and clear buttons
     st.markdown("<br>", unsafe_allow_html=True)
-    col_clear1, col_clear2, col_clear3 = st.columns([1, 1, 1])
+    col_prev, col_export, col_clear2, col_next = st.columns([1, 1, 1, 1])
+    with col_prev:
+        if st.button("◀ Newer", disabled=st.session_state.gallery_page == 0, use_container_width=True):
+            st.session_state.gallery_page -= 1
+            st.rerun()
+    with col_next:
+        if st.button("Older ▶", disabled=st.session_state.gallery_page >= page_count - 1, use_container_width=True):
+            st.session_state.gallery_page += 1
+            st.rerun()
+    st.caption(f"Page {st.session_state.gallery_page + 1} of {page_count} ({page_total} images)")
+    with col_export:
+        # The ZIP (of the newest images matching the search) is only built when the button is clicked
+        st.download_button(
+            "📦 Download All",
+            data=lambda: build_history_zip(
+                gallery, gallery.entries(gallery_query, GALLERY_EXPORT_MAX_IMAGES, gallery_session)
+            ),
+            help=f"The newest {GALLERY_EXPORT_MAX_IMAGES} images matching the search",
+            file_name=f"ai_generated_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip",
+            key="download_all",
+            use_container_width=True
+        )
     with col_clear2:
-        if st.button("🗑️ Clear History", use_container_width=True):
-            st.session_state.image_history = []
+        # Only this session's own images; the rest belong to other visitors
+        if st.button("🗑️ Clear My Images", use_container_width=True):
+            gallery.clear(st.session_state.session_id)
+            st.session_state.gallery_page = 0
             st.rerun()
 
 # Footer
@@ -601,3 +748,14 @@ st.markdown(
     "<p style='text-align: center; color: #4a5568; font-size: 0.9rem;'>⚡ Powered by HuggingFace Inference API | Built with Streamlit</p>",
     unsafe_allow_html=True
 )
+
+# Create the client in the background once the page is on screen, so neither the
+# first render nor the first generation waits for it
+@st.cache_resource(show_spinner=False)
+def preload_client(token):
+    thread = threading.Thread(target=get_client, args=(token,), name="client-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+preload_client(HUGGINGFACE_TOKEN)
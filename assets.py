@@ -0,0 +1,29 @@
+import hashlib
+import os
+from functools import lru_cache
+
+from config import STYLES_PATH
+
+# URL of static/ when Streamlit's static file serving is enabled
+STATIC_URL = "app/static/"
+
+
+@lru_cache(maxsize=1)
+def load_css():
+    """Return the page stylesheet wrapped for st.markdown, read once per process."""
+    with open(STYLES_PATH, encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+
+@lru_cache(maxsize=1)
+def stylesheet_link():
+    """<link> to the served stylesheet, versioned by content so browsers cache it safely."""
+    with open(STYLES_PATH, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f'<link rel="stylesheet" href="{STATIC_URL}{os.path.basename(STYLES_PATH)}?v={version}">'
+
+
+def page_style(static_serving):
+    """Markup that styles the page: a small link the browser caches when static
+    files are served, otherwise the inline stylesheet."""
+    return stylesheet_link() if static_serving else load_css()
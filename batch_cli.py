@@ -0,0 +1,219 @@
+"""Headless batch runner: generate images for every row of a CSV or JSONL file.
+
+Each row needs a "prompt"; optional columns are id, style, aspect, model,
+realism, lighting, detail, camera, negative_prompt and seed. Images are
+written to the output directory (PNG by default, see --format) as they finish, together with a
+manifest.jsonl line per row. Re-running with the same output directory
+skips rows that already finished.
+
+    python batch_cli.py prompts.csv --output out/ --concurrency 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# Load .env before the modules below read their settings at import time
+load_dotenv()
+
+from config import ASPECT_MAP, CAMERA_STYLES, DETAIL_LEVELS, LIGHTING_STYLES, MODEL_CHOICES, REALISM_LEVELS, STYLE_PROMPTS
+from generation import run_batch
+from imaging import OUTPUT_FORMAT, OUTPUT_FORMATS, OUTPUT_QUALITY, PNG_COMPRESS_LEVEL, cached_output, output_formats
+from inference import create_client
+from jobs import BATCH_MAX_WORKERS
+from metrics import METRICS
+from prompts import clean_negative_prompt, enhance_prompt
+from rate_limit import DEFAULT_QUEUE
+from result_cache import create_result_cache
+from similarity_cache import SimilarityIndex
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# Column defaults match the UI defaults
+ROW_DEFAULTS = {
+    "style": "None",
+    "aspect": "1:1 (Square)",
+    "model": next(iter(MODEL_CHOICES)),
+    "realism": "Balanced",
+    "lighting": "Default",
+    "detail": "Default",
+    "camera": "Default",
+    "negative_prompt": "",
+}
+
+
+def read_rows(path):
+    """Yield dict rows from a .csv or .jsonl file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def resolve_model(value):
+    # Accept either the UI label or a full model ID
+    return MODEL_CHOICES.get(value, value)
+
+
+def build_request(row, defaults):
+    """Turn an input row into generate_image keyword arguments."""
+    values = dict(defaults)
+    values.update({key: value for key, value in row.items() if value not in (None, "")})
+
+    for key, allowed in (("style", STYLE_PROMPTS), ("aspect", ASPECT_MAP), ("realism", REALISM_LEVELS),
+                         ("lighting", LIGHTING_STYLES), ("detail", DETAIL_LEVELS), ("camera", CAMERA_STYLES)):
+        if values[key] not in allowed:
+            raise ValueError(f"unknown {key} {values[key]!r}")
+
+    width, height = ASPECT_MAP[values["aspect"]]
+    request = {
+        "prompt": enhance_prompt(
+            values["prompt"], values["realism"], values["lighting"],
+            values["detail"], values["camera"], values["style"]
+        ),
+        "negative_prompt": clean_negative_prompt(values["negative_prompt"]),
+        "model": resolve_model(values["model"]),
+        "width": width,
+        "height": height,
+    }
+    if values.get("seed") is not None:
+        request["seed"] = int(values["seed"])
+    return request
+
+
+def load_finished(manifest_path, output_dir):
+    """IDs already written successfully by an earlier run."""
+    finished = set()
+    if not os.path.exists(manifest_path):
+        return finished
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial line from an interrupted run
+                continue
+            if record.get("status") == "ok" and os.path.exists(os.path.join(output_dir, record["file"])):
+                finished.add(record["id"])
+    return finished
+
+
+def run(args):
+    token = os.getenv("HUGGINGFACE_TOKEN")
+    if not token:
+        sys.exit("HUGGINGFACE_TOKEN is not set (see .env.example)")
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_NAME)
+    finished = load_finished(manifest_path, args.output)
+
+    if args.rate_per_minute:
+        DEFAULT_QUEUE.bucket.rate = args.rate_per_minute / 60.0
+
+    defaults = dict(ROW_DEFAULTS)
+    for key in ("style", "aspect", "model"):
+        if getattr(args, key):
+            defaults[key] = getattr(args, key)
+
+    client = create_client(token, warm=False)
+    cache = None if args.no_cache else create_result_cache()
+    similar = SimilarityIndex(threshold=args.similar) if args.similar and cache is not None else None
+
+    stats = {"done": 0, "failed": 0, "skipped": 0, "invalid": 0}
+    pending = {}  # batch index -> (row id, input prompt, request)
+    batch_index = itertools.count()
+
+    def jobs():
+        # Rows are read lazily so huge inputs never sit in memory at once
+        for position, row in enumerate(read_rows(args.input)):
+            row_id = re.sub(r"[^\w.-]", "_", str(row.get("id") or position))
+            if row_id in finished:
+                stats["skipped"] += 1
+                continue
+            try:
+                request = build_request(row, defaults)
+            except (KeyError, ValueError) as e:
+                stats["invalid"] += 1
+                print(f"[{row_id}] skipped invalid row: {e}", file=sys.stderr)
+                continue
+            if similar is not None:
+                request["similar"] = similar
+            pending[next(batch_index)] = (row_id, row["prompt"], request)
+            yield request
+
+    started = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        for index, result, error in run_batch(client, jobs(), cache=cache, max_workers=args.concurrency):
+            row_id, prompt, request = pending.pop(index)
+            record = {
+                "id": row_id,
+                "prompt": prompt,
+                "final_prompt": request["prompt"],
+                "model": request["model"],
+                "width": request["width"],
+                "height": request["height"],
+            }
+            if error is not None:
+                stats["failed"] += 1
+                record.update(status="error", error=str(error))
+            else:
+                image, png_bytes, cache_hit = result
+                image_bytes, encode_seconds = cached_output(
+                    png_bytes, args.format, args.quality, args.compress_level, image=image
+                )
+                file_name = f"{row_id}.{OUTPUT_FORMATS[args.format][1]}"
+                with open(os.path.join(args.output, file_name), "wb") as f:
+                    f.write(image_bytes)
+                stats["done"] += 1
+                record.update(status="ok", file=file_name, bytes=len(image_bytes), png_bytes=len(png_bytes),
+                              encode_ms=round(encode_seconds * 1000, 1), cache_hit=cache_hit)
+
+            # One line per row, flushed so an interrupted run can resume
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            if not args.quiet:
+                print(f"[{row_id}] {record['status']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    summary = dict(stats)
+    summary.update(
+        elapsed_s=round(elapsed, 2),
+        images_per_minute=round(stats["done"] / elapsed * 60, 2) if elapsed else 0.0,
+        inference_latency=[row for row in METRICS.summary() if row["stage"] == "inference"],
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if stats["failed"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate images for every row of a CSV/JSONL prompt file.")
+    parser.add_argument("input", help="CSV or JSONL file with a 'prompt' column")
+    parser.add_argument("--output", "-o", default="batch_output", help="directory for images and manifest.jsonl")
+    parser.add_argument("--concurrency", "-c", type=int, default=BATCH_MAX_WORKERS,
+                        help="concurrent inference calls (default: BATCH_MAX_WORKERS)")
+    parser.add_argument("--style", choices=list(STYLE_PROMPTS), help="default style preset")
+    parser.add_argument("--aspect", choices=list(ASPECT_MAP), help="default aspect ratio")
+    parser.add_argument("--model", help="default model (UI label or model ID)")
+    parser.add_argument("--format", choices=output_formats(), default=OUTPUT_FORMAT, help="output image format")
+    parser.add_argument("--quality", type=int, default=OUTPUT_QUALITY, help="WebP/JPEG/AVIF quality")
+    parser.add_argument("--compress-level", type=int, choices=range(10), default=PNG_COMPRESS_LEVEL,
+                        metavar="0-9", help="PNG compression level")
+    parser.add_argument("--rate-per-minute", type=float, help="override HF_RATE_LIMIT_PER_MINUTE")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the on-disk result cache")
+    parser.add_argument("--similar", type=float, metavar="THRESHOLD",
+                        help="reuse results of near-duplicate prompts at this similarity (e.g. 0.9)")
+    parser.add_argument("--quiet", "-q", action="store_true")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
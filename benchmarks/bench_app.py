@@ -0,0 +1,134 @@
+"""Offline benchmark of app.py against the local stub inference server.
+
+Drives the generate, history-render and download paths headlessly through
+Streamlit's AppTest and reports per-rerun CPU time, Python heap growth
+and end-to-end throughput. No HuggingFace quota is used.
+
+    python benchmarks/bench_app.py --generations 20 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import StubInferenceServer  # noqa: E402
+
+ASPECT_RATIOS = ["1:1 (Square)", "16:9 (Landscape)", "9:16 (Portrait)", "4:3 (Standard)", "3:2 (Photo)"]
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]  # noqa: E731
+    return {"p50": round(pick(0.5), 4), "p95": round(pick(0.95), 4), "max": round(ordered[-1], 4)}
+
+
+class RerunTimer:
+    """Runs the AppTest and records wall and CPU time for every rerun."""
+
+    def __init__(self, app):
+        self.app = app
+        self.cpu = []
+        self.wall = []
+
+    def run(self, action=None):
+        started_wall = time.perf_counter()
+        started_cpu = time.process_time()
+        (action or self.app).run()
+        self.cpu.append(time.process_time() - started_cpu)
+        self.wall.append(time.perf_counter() - started_wall)
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].value)
+
+
+def run_benchmark(generations, latency, error_rate, idle_reruns, poll_interval):
+    stub = StubInferenceServer(latency=latency, jitter=latency / 4, error_rate=error_rate).start()
+
+    # Configuration is read at import time, so set it before the app runs
+    os.environ.update({
+        "HUGGINGFACE_TOKEN": "hf_benchmark",
+        "HF_INFERENCE_BASE_URL": stub.url,
+        "HF_WARMUP_URL": "",
+        "HF_RATE_LIMIT_PER_MINUTE": "100000",
+        "HF_RATE_LIMIT_BURST": "1000",
+        "RESULT_CACHE_DIR": tempfile.mkdtemp(prefix="bench-cache-"),
+        "GALLERY_DIR": tempfile.mkdtemp(prefix="bench-gallery-"),
+    })
+
+    from streamlit.testing.v1 import AppTest
+
+    from gallery import Gallery
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    timer = RerunTimer(app)
+    tracemalloc.start()
+    timer.run()
+    baseline_memory = tracemalloc.get_traced_memory()[0]
+
+    # Generate path: one click per image, then poll until the job lands in history
+    started = time.perf_counter()
+    for index in range(generations):
+        next(s for s in app.selectbox if s.label == "Aspect Ratio").set_value(ASPECT_RATIOS[index % len(ASPECT_RATIOS)])
+        app.text_area[0].input(f"benchmark prompt {index}")
+        timer.run(next(b for b in app.button if "GENERATE" in b.label).click())
+        while app.session_state.pending_jobs:
+            time.sleep(poll_interval)
+            timer.run()
+    elapsed = time.perf_counter() - started
+    generate_cpu = list(timer.cpu)
+
+    # History-render and download path: plain reruns with a full history grid
+    timer.cpu, timer.wall = [], []
+    for _ in range(idle_reruns):
+        timer.run()
+
+    history_items = Gallery().count(session_id=app.session_state.session_id)
+    current_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stub.stop()
+
+    return {
+        "generations": generations,
+        "stub_latency_s": latency,
+        "stub_error_rate": error_rate,
+        "stub_requests": stub.requests,
+        "stub_errors": stub.errors,
+        "wall_time_s": round(elapsed, 3),
+        "throughput_images_per_s": round(generations / elapsed, 3) if elapsed else None,
+        "generate_rerun_cpu_s": percentiles(generate_cpu),
+        "history_rerun_cpu_s": percentiles(timer.cpu),
+        "history_rerun_wall_s": percentiles(timer.wall),
+        "history_items": history_items,
+        "python_heap_growth_bytes": current_memory - baseline_memory,
+        "python_heap_peak_bytes": peak_memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py against a local stub inference server.")
+    parser.add_argument("--generations", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean stub response time in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--idle-reruns", type=int, default=20, help="reruns with a full history grid")
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.generations, args.latency, args.error_rate, args.idle_reruns, args.poll_interval)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Startup benchmark: time-to-first-render of app.py for new sessions.
+
+Cold starts run the first session in a fresh Python process (imports,
+per-process setup and the first script run); warm starts open new
+sessions in a process that has already served one. The same timing of an
+empty script is reported as harness overhead, so `app_*` numbers are the
+app's own share. No network is used.
+
+    python benchmarks/bench_startup.py --cold 5 --warm 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+EMPTY_SCRIPT = 'import streamlit as st\nst.write("")\n'
+
+# Offline settings: no warm-up request, throwaway cache and gallery directories
+ENV = {
+    "HUGGINGFACE_TOKEN": "hf_benchmark",
+    "HF_WARMUP_URL": "",
+    "HF_INFERENCE_BASE_URL": "http://127.0.0.1:9",
+}
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]  # noqa: E731
+    return {"p50": round(pick(0.5), 4), "p95": round(pick(0.95), 4), "max": round(ordered[-1], 4)}
+
+
+def first_render(app_test, script):
+    """Seconds for one new session's first script run."""
+    app = app_test.from_file(script, default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    seconds = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return seconds
+
+
+def child(warm):
+    # One process: streamlit import, the first session, then `warm` more sessions
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import = time.perf_counter() - started
+
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(EMPTY_SCRIPT)
+    harness = [first_render(AppTest, f.name) for _ in range(max(3, warm))]
+    os.remove(f.name)
+
+    script = os.path.join(ROOT, "app.py")
+    first = first_render(AppTest, script)
+    warm_runs = [first_render(AppTest, script) for _ in range(warm)]
+    print(json.dumps({
+        "streamlit_import_s": streamlit_import,
+        "harness_s": min(harness),
+        "first_session_s": first,
+        "warm_sessions_s": warm_runs,
+    }))
+
+
+def run_benchmark(cold, warm):
+    env = dict(os.environ, **ENV)
+    cold_runs = []
+    for index in range(cold):
+        env["RESULT_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+        env["GALLERY_DIR"] = tempfile.mkdtemp(prefix="bench-gallery-")
+        # Only the last process also measures warm sessions
+        args = [sys.executable, os.path.abspath(__file__), "--child", str(warm if index == cold - 1 else 0)]
+        started = time.perf_counter()
+        output = subprocess.run(args, env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        process_seconds = time.perf_counter() - started
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_s"] = process_seconds
+        cold_runs.append(result)
+
+    return {
+        "cold_starts": cold,
+        "warm_sessions": warm,
+        "cold_process_s": percentiles([run["process_s"] for run in cold_runs]),
+        "cold_streamlit_import_s": percentiles([run["streamlit_import_s"] for run in cold_runs]),
+        "harness_s": round(min(run["harness_s"] for run in cold_runs), 4) if cold_runs else None,
+        "app_cold_first_session_s": percentiles([run["first_session_s"] - run["harness_s"] for run in cold_runs]),
+        "app_warm_session_s": percentiles(
+            [seconds - cold_runs[-1]["harness_s"] for seconds in cold_runs[-1]["warm_sessions_s"]]
+        ) if cold_runs else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-render of app.py for new sessions.")
+    parser.add_argument("--cold", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--warm", type=int, default=20, help="new sessions in an already warm process")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child)
+        return
+
+    report = run_benchmark(args.cold, args.warm)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Tiny in-memory Redis-protocol server for trying shared state offline.
+
+Supports only the commands shared_state.RedisStore uses (PING, GET, SET
+with PX/EX/NX, DEL, INCR, INCRBY, DECRBY, PEXPIRE, PTTL, RPUSH, LPOP,
+SELECT). Run it, then start each replica with SHARED_STATE_URL=redis://127.0.0.1:6390/0.
+
+    python benchmarks/resp_server.py --port 6390
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+_data = {}  # key -> (value, expires or None)
+_lock = threading.Lock()
+
+
+def _live(key):
+    item = _data.get(key)
+    if item is not None and item[1] is not None and item[1] <= time.time():
+        del _data[key]
+        return None
+    return item
+
+
+def bulk(value):
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def execute(args):
+    name = args[0].upper()
+    with _lock:
+        if name in (b"PING", b"SELECT", b"AUTH"):
+            return b"+OK\r\n" if name != b"PING" else b"+PONG\r\n"
+        if name == b"GET":
+            item = _live(args[1])
+            return bulk(item[0] if item else None)
+        if name == b"SET":
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+                if unit in options:
+                    expires = time.time() + int(args[3 + options.index(unit) + 1]) / scale
+            if b"NX" in options and _live(args[1]) is not None:
+                return bulk(None)
+            _data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(1 for key in args[1:] if _live(key) is not None and _data.pop(key))
+            return b":%d\r\n" % removed
+        if name in (b"INCR", b"INCRBY", b"DECRBY"):
+            item = _live(args[1])
+            step = 1 if name == b"INCR" else int(args[2])
+            value = (int(item[0]) if item else 0) + (-step if name == b"DECRBY" else step)
+            _data[args[1]] = (str(value).encode(), item[1] if item else None)
+            return b":%d\r\n" % value
+        if name == b"RPUSH":
+            item = _live(args[1])
+            values = item[0] if item else []
+            values.extend(args[2:])
+            _data[args[1]] = (values, item[1] if item else None)
+            return b":%d\r\n" % len(values)
+        if name == b"LPOP":
+            item = _live(args[1])
+            if not item or not item[0]:
+                return bulk(None)
+            return bulk(item[0].pop(0))
+        if name == b"PEXPIRE":
+            item = _live(args[1])
+            if item is None:
+                return b":0\r\n"
+            _data[args[1]] = (item[0], time.time() + int(args[2]) / 1000)
+            return b":1\r\n"
+        if name == b"PTTL":
+            item = _live(args[1])
+            if item is None:
+                return b":-2\r\n"
+            return b":-1\r\n" if item[1] is None else b":%d\r\n" % int((item[1] - time.time()) * 1000)
+    return b"-ERR unknown command '%s'\r\n" % name
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if not args:
+                return
+            self.wfile.write(execute(args))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start(port=6390):
+    """Start the server on a background thread and return it."""
+    server = Server(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = Server(("127.0.0.1", args.port), Handler)
+    print(f"RESP stand-in listening on redis://127.0.0.1:{args.port}/0")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
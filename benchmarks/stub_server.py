@@ -0,0 +1,176 @@
+"""Local fake of the HuggingFace inference endpoint for offline benchmarks.
+
+Returns synthetic PNGs at the requested width/height after a configurable
+delay, and fails a configurable share of requests with 503/429 (or a
+scripted sequence of statuses, for tests). POSTs to
+/v1/images/generations get an OpenAI-style JSON answer instead, so the
+stub can also stand in for an "openai" router backend; with "stream": true
+it sends "partial_images" blurry previews as server-sent events first.
+
+    python benchmarks/stub_server.py --port 8765 --latency 0.5 --error-rate 0.1
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+DEFAULT_SIZE = (1024, 1024)
+
+
+def synthetic_image(width, height, seed):
+    # Cheap gradient noise so PNG sizes resemble real content more than a flat fill
+    rng = random.Random(seed)
+    small = Image.new("RGB", (16, 16))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(256)])
+    image = small.resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class StubInferenceServer:
+    """Threaded HTTP server answering text-to-image and image-to-image POSTs.
+
+    `statuses` answers the first requests with these status codes in order
+    (429 and 503 get the usual retry hints, 200 an image) before error_rate
+    applies.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, jitter=0.2, error_rate=0.0, statuses=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.statuses = list(statuses)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="stub-inference", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                openai_style = self.path.rstrip("/").endswith("/images/generations")
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    payload = {}
+                if openai_style:
+                    width, _, height = str(payload.get("size") or "").partition("x")
+                    parameters = {"width": width, "height": height, "seed": payload.get("seed"),
+                                  "num_inference_steps": payload.get("steps")}
+                else:
+                    parameters = payload.get("parameters") or {}
+
+                with stub._lock:
+                    stub.requests += 1
+                    count = stub.requests
+                    if stub.statuses:
+                        status = stub.statuses.pop(0)
+                    else:
+                        status = random.choice([429, 503]) if random.random() < stub.error_rate else 200
+                    failed = status != 200
+                    if failed:
+                        stub.errors += 1
+
+                delay = max(0.0, random.gauss(stub.latency, stub.jitter))
+                if parameters.get("num_inference_steps"):
+                    # Few-step (preview) requests answer proportionally faster; 4 steps is full latency
+                    delay *= min(1.0, int(parameters["num_inference_steps"]) / 4)
+                width = int(parameters.get("width") or DEFAULT_SIZE[0])
+                height = int(parameters.get("height") or DEFAULT_SIZE[1])
+                seed = parameters.get("seed")
+                seed = count if seed is None else seed
+
+                if openai_style and payload.get("stream") and not failed:
+                    self._stream(width, height, seed, delay, int(payload.get("partial_images") or 0))
+                    return
+
+                time.sleep(delay)
+
+                if failed:
+                    payload = {"error": "Model is currently loading", "estimated_time": 0.5} if status == 503 else {"error": "Rate limit reached"}
+                    self._send(status, json.dumps(payload).encode("utf-8"), "application/json", {"Retry-After": "0.5"} if status == 429 else {})
+                    return
+
+                image = synthetic_image(width, height, seed)
+                if openai_style:
+                    answer = {"created": int(time.time()), "data": [{"b64_json": base64.b64encode(image).decode("ascii")}]}
+                    self._send(200, json.dumps(answer).encode("utf-8"), "application/json")
+                else:
+                    self._send(200, image, "image/png")
+
+            def _stream(self, width, height, seed, delay, partial_images):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for index in range(partial_images + 1):
+                    time.sleep(delay / (partial_images + 1))
+                    if index < partial_images:
+                        # Coarser the earlier the step
+                        step = 2 ** (partial_images - index + 2)
+                        image = synthetic_image(max(16, width // step), max(16, height // step), seed)
+                        event = {"type": "image_generation.partial_image", "partial_image_index": index}
+                    else:
+                        image = synthetic_image(width, height, seed)
+                        event = {"type": "image_generation.completed"}
+                    event["b64_json"] = base64.b64encode(image).decode("ascii")
+                    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+            def _send(self, status, data, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/503")
+    args = parser.parse_args()
+
+    server = StubInferenceServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Stub inference server on {server.url} (set HF_INFERENCE_BASE_URL to use it)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
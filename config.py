@@ -0,0 +1,58 @@
+import os
+from types import MappingProxyType
+
+# Models offered in the UI and the batch runner
+MODEL_CHOICES = MappingProxyType({
+    "FLUX.1 Schnell (Fast)": "black-forest-labs/FLUX.1-schnell",
+    "Stable Diffusion XL": "stabilityai/stable-diffusion-xl-base-1.0",
+})
+DEFAULT_MODEL = MODEL_CHOICES["FLUX.1 Schnell (Fast)"]
+IMAGE_TO_IMAGE_MODEL = "stabilityai/stable-diffusion-xl-refiner-1.0"
+
+# Map aspect ratios to dimensions
+ASPECT_MAP = MappingProxyType({
+    "1:1 (Square)": (1024, 1024),
+    "16:9 (Landscape)": (1344, 768),
+    "9:16 (Portrait)": (768, 1344),
+    "4:3 (Standard)": (1152, 896),
+    "3:2 (Photo)": (1216, 832)
+})
+
+STYLE_PROMPTS = MappingProxyType({
+    "None": "",
+    "Cinematic": "cinematic lighting, movie still, dramatic atmosphere, film grain",
+    "Anime": "anime style, studio ghibli, vibrant colors, detailed illustration",
+    "Digital Art": "digital art, trending on artstation, highly detailed, sharp focus",
+    "Oil Painting": "oil painting, classical art style, brush strokes visible, museum quality",
+    "Watercolor": "watercolor painting, soft edges, artistic, flowing colors",
+    "Sketch": "pencil sketch, black and white, detailed drawing, artistic",
+    "3D Render": "3D render, octane render, unreal engine 5, highly detailed, realistic",
+    "Vintage Photo": "vintage photograph, 1970s aesthetic, film grain, nostalgic",
+    "Neon Cyberpunk": "cyberpunk, neon lights, futuristic city, blade runner style",
+    "Fantasy Art": "fantasy art, magical, ethereal lighting, epic composition",
+    "Minimalist": "minimalist, clean lines, simple composition, modern design",
+    "Pop Art": "pop art style, bold colors, andy warhol inspired",
+    "Gothic": "gothic art, dark atmosphere, dramatic shadows, mysterious",
+    "Steampunk": "steampunk style, brass and copper, victorian era, mechanical elements"
+})
+
+# Advanced style options
+REALISM_LEVELS = ("Artistic", "Balanced", "Photorealistic", "Hyper-realistic")
+DETAIL_LEVELS = ("Default", "Highly detailed", "Intricate details", "8K ultra detailed")
+LIGHTING_STYLES = ("Default", "Soft natural light", "Golden hour", "Dramatic lighting",
+                   "Studio lighting", "Cinematic", "Neon glow", "Moonlight")
+CAMERA_STYLES = ("Default", "DSLR photo", "35mm film", "Portrait lens",
+                 "Wide angle", "Macro shot", "Aerial view", "Bokeh effect")
+
+REALISM_PROMPTS = MappingProxyType({
+    "Artistic": "artistic interpretation, creative",
+    "Balanced": "",
+    "Photorealistic": "photorealistic, ultra realistic",
+    "Hyper-realistic": "hyper-realistic, ultra realistic, lifelike, 8K",
+})
+
+# Always added to the end of every prompt
+QUALITY_BOOSTERS = "masterpiece, best quality"
+
+# Page CSS, read once per process
+STYLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "styles.css")
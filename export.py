@@ -0,0 +1,59 @@
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+# Archives up to this size stay in memory; larger ones spill to a temp file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = "manifest.json"
+
+
+def created_datetime(entry):
+    """The entry's creation time as an aware local datetime, or None for entries without one."""
+    if entry.get("created") is None:
+        return None
+    return datetime.fromtimestamp(entry["created"]).astimezone()
+
+
+def history_file_name(entry, index, extension=None):
+    extension = extension or entry.get("extension", "png")
+    created = created_datetime(entry)
+    # ISO 8601 basic format: sortable, and without the colons some file systems reject
+    stamp = created.strftime("%Y%m%dT%H%M%S") if created else entry["timestamp"].replace(":", "-")
+    return f"ai_generated_{stamp}_{index}.{extension}"
+
+
+def build_history_zip(store, entries, chunk_size=CHUNK_SIZE):
+    """Write the stored image bytes of `entries` plus a JSON manifest into a ZIP.
+
+    Images are copied chunk by chunk from the gallery files and stored
+    without recompression (they are already PNG/WebP/JPEG); entries whose file
+    has been removed meanwhile are left out. Returns a file object positioned
+    at the start of the archive.
+    """
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    manifest = []
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        for index, entry in enumerate(entries):
+            source = store.open_image(entry)
+            if source is None:
+                continue
+            name = history_file_name(entry, index)
+            created = created_datetime(entry)
+            with source, zf.open(name, "w") as target:
+                shutil.copyfileobj(source, target, chunk_size)
+            manifest.append({
+                "file": name,
+                "prompt": entry["prompt"],
+                "style": entry.get("style", "None"),
+                "timestamp": entry["timestamp"],
+                "created": created.isoformat(timespec="seconds") if created else None,
+                "model": entry.get("model"),
+                "final_prompt": entry.get("final_prompt"),
+                "bytes": entry["size"],
+            })
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    archive.seek(0)
+    return archive
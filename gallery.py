@@ -0,0 +1,315 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from imaging import cached_thumbnail
+
+DEFAULT_GALLERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "gallery")
+INDEX_NAME = "gallery.sqlite3"
+THUMBNAIL_SUFFIX = ".thumb"
+# clear() keeps image files written this recently, which another replica
+# sharing GALLERY_DIR may be about to index
+BLOB_GRACE_SECONDS = 60
+
+# Retention: the oldest entries are pruned past either limit (0 disables it)
+GALLERY_MAX_BYTES = int(os.getenv("GALLERY_MAX_MB", "1024")) * 1024 * 1024
+GALLERY_MAX_AGE_SECONDS = float(os.getenv("GALLERY_MAX_AGE_DAYS", "0")) * 24 * 3600
+PRUNE_INTERVAL_SECONDS = 60
+PRUNE_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    final_prompt TEXT,
+    style TEXT,
+    model TEXT,
+    width INTEGER,
+    height INTEGER,
+    timestamp TEXT,
+    created REAL NOT NULL,
+    negative_prompt TEXT,
+    draft INTEGER NOT NULL DEFAULT 0,
+    target_width INTEGER,
+    target_height INTEGER,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS images_created ON images (created DESC);
+"""
+
+# External-content FTS index over the prompts, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+    prompt, final_prompt, content='images', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts (rowid, prompt, final_prompt) VALUES (new.rowid, new.prompt, new.final_prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt, final_prompt) VALUES ('delete', old.rowid, old.prompt, old.final_prompt);
+END;
+"""
+
+COLUMNS = ("id", "digest", "size", "prompt", "final_prompt", "style", "model", "width", "height", "timestamp", "created",
+           "negative_prompt", "draft", "target_width", "target_height", "session_id")
+
+# Columns added after the first release, created on older index files
+ADDED_COLUMNS = (
+    ("negative_prompt", "TEXT"),
+    ("draft", "INTEGER NOT NULL DEFAULT 0"),
+    ("target_width", "INTEGER"),
+    ("target_height", "INTEGER"),
+    ("session_id", "TEXT"),
+)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix."""
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+class Gallery:
+    """Durable image gallery kept across sessions and process restarts.
+
+    Metadata lives in a SQLite index with full-text search over prompts;
+    images and thumbnails are content-addressed files, so an image generated
+    twice is stored once. Queries return metadata only, and image bytes are
+    read from disk when a page actually shows or downloads them. Each entry
+    records the session that added it, so queries can be limited to one
+    session's images and a session can only remove its own.
+    The oldest entries are pruned once the images exceed max_bytes or max_age
+    seconds.
+    """
+
+    def __init__(self, directory=None, max_bytes=GALLERY_MAX_BYTES, max_age=GALLERY_MAX_AGE_SECONDS):
+        self.directory = directory or os.getenv("GALLERY_DIR", DEFAULT_GALLERY_DIR)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._last_prune = 0.0
+        self.blob_dir = os.path.join(self.directory, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.directory, INDEX_NAME), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+            existing = {row["name"] for row in self._db.execute("PRAGMA table_info(images)")}
+            for column, definition in ADDED_COLUMNS:
+                if column not in existing:
+                    self._db.execute(f"ALTER TABLE images ADD COLUMN {column} {definition}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS images_session ON images (session_id)")
+            has_fts = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'images_fts'").fetchone()
+            try:
+                self._db.executescript(FTS_SCHEMA)
+                if not has_fts:
+                    # Index rows written before the FTS table existed
+                    self._db.execute("INSERT INTO images_fts (images_fts) VALUES ('rebuild')")
+                self.full_text = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: fall back to LIKE matching
+                self.full_text = False
+
+    def _blob_path(self, digest, suffix=""):
+        return os.path.join(self.blob_dir, digest[:2], digest + suffix)
+
+    def _write_blob(self, path, data):
+        try:
+            # Already stored: mark it as recently written so clear() keeps it
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def add(self, data, prompt, style, timestamp, image=None, final_prompt=None, model=None,
+            width=None, height=None, negative_prompt=None, draft=False, target_width=None, target_height=None,
+            session_id=None):
+        """Store encoded image bytes and their metadata, returning the new entry.
+
+        Drafts keep the full-size target dimensions they can be upscaled to;
+        session_id identifies the session that may later remove the entry.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        thumbnail = cached_thumbnail(data, image)
+        if image is not None and width is None:
+            width, height = image.size
+
+        entry = {
+            "id": uuid.uuid4().hex,
+            "digest": digest,
+            "size": len(data),
+            "prompt": prompt,
+            "final_prompt": final_prompt,
+            "style": style,
+            "model": model,
+            "width": width,
+            "height": height,
+            "timestamp": timestamp,
+            "created": time.time(),
+            "negative_prompt": negative_prompt,
+            "draft": int(bool(draft)),
+            "target_width": target_width,
+            "target_height": target_height,
+            "session_id": session_id,
+        }
+        # Files and row together, so a concurrent clear() cannot remove the
+        # files of an entry that is about to be indexed
+        with self._lock, self._db:
+            self._write_blob(self._blob_path(digest), data)
+            self._write_blob(self._blob_path(digest, THUMBNAIL_SUFFIX), thumbnail)
+            self._db.execute(
+                f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [entry[column] for column in COLUMNS]
+            )
+        if (self.max_bytes or self.max_age) and entry["created"] - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+            self._last_prune = entry["created"]
+            self.prune()
+        return entry
+
+    def _where(self, query, session_id=None):
+        conditions, params = [], []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if query and query.strip():
+            if self.full_text:
+                conditions.append("rowid IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)")
+                params.append(fts_query(query))
+            else:
+                pattern = f"%{query.strip()}%"
+                conditions.append("(prompt LIKE ? OR final_prompt LIKE ?)")
+                params += [pattern, pattern]
+        if not conditions:
+            return "", []
+        return "WHERE " + " AND ".join(conditions), params
+
+    def count(self, query=None, session_id=None):
+        where, params = self._where(query, session_id)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM images {where}", params).fetchone()[0]
+
+    def page(self, query=None, offset=0, limit=8, session_id=None):
+        """Return (entries, total) for one page of the newest matching images,
+        only those added by session_id unless it is None."""
+        where, params = self._where(query, session_id)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM images {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM images {where} ORDER BY created DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def entries(self, query=None, limit=None, session_id=None):
+        """All matching entries, newest first (metadata only)."""
+        return self.page(query, 0, -1 if limit is None else limit, session_id)[0]
+
+    def get(self, entry_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM images WHERE id = ?", (entry_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _read_blob(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def thumbnail(self, entry):
+        """Thumbnail bytes, or None if the image files are gone."""
+        return self._read_blob(self._blob_path(entry["digest"], THUMBNAIL_SUFFIX))
+
+    def image_bytes(self, entry):
+        """Full-size encoded bytes, or None if the image file is gone."""
+        return self._read_blob(self._blob_path(entry["digest"]))
+
+    def open_image(self, entry):
+        """Open the full-size image file for reading, or return None if it is gone."""
+        try:
+            return open(self._blob_path(entry["digest"]), "rb")
+        except FileNotFoundError:
+            return None
+
+    def clear(self, session_id=None):
+        """Delete the images added by session_id, or every image when it is None.
+
+        Image files still referenced by other entries, or written in the last
+        BLOB_GRACE_SECONDS (possibly for an entry another replica is adding),
+        are kept.
+        """
+        if session_id is None:
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM images")
+                shutil.rmtree(self.blob_dir, ignore_errors=True)
+                os.makedirs(self.blob_dir, exist_ok=True)
+            return
+
+        with self._lock, self._db:
+            digests = {row[0] for row in self._db.execute(
+                "SELECT DISTINCT digest FROM images WHERE session_id = ?", (session_id,)
+            )}
+            self._db.execute("DELETE FROM images WHERE session_id = ?", (session_id,))
+            for digest in digests:
+                if self._db.execute("SELECT 1 FROM images WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                    continue
+                self._remove_blobs(digest, time.time() - BLOB_GRACE_SECONDS)
+
+    def prune(self, max_bytes=None, max_age=None):
+        """Delete the oldest entries until the stored images fit in max_bytes and
+        none is older than max_age seconds (defaults: the gallery's limits; 0
+        disables a limit). Returns the number of entries removed.
+
+        Image files are removed once no remaining entry references them.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        now = time.time()
+        cutoff = now - max_age if max_age else None
+        removed = 0
+        with self._lock, self._db:
+            # Identical images share one file, so count each digest once
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM images GROUP BY digest)"
+            ).fetchone()[0]
+            while True:
+                rows = self._db.execute(
+                    "SELECT id, digest, size, created FROM images ORDER BY created LIMIT ?", (PRUNE_BATCH,)
+                ).fetchall()
+                for row in rows:
+                    too_old = cutoff is not None and row["created"] < cutoff
+                    if not too_old and (not max_bytes or total <= max_bytes):
+                        return removed
+                    self._db.execute("DELETE FROM images WHERE id = ?", (row["id"],))
+                    removed += 1
+                    if self._db.execute("SELECT 1 FROM images WHERE digest = ? LIMIT 1", (row["digest"],)).fetchone():
+                        continue
+                    total -= row["size"]
+                    self._remove_blobs(row["digest"], now - BLOB_GRACE_SECONDS)
+                if len(rows) < PRUNE_BATCH:
+                    return removed
+
+    def _remove_blobs(self, digest, written_before):
+        for suffix in ("", THUMBNAIL_SUFFIX):
+            path = self._blob_path(digest, suffix)
+            try:
+                if os.path.getmtime(path) < written_before:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,170 @@
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from imaging import decode_image, encode_png, upscale_reference
+from jobs import BATCH_MAX_WORKERS
+from metrics import METRICS
+from previews import PreviewSink, preview_context, start_low_res_preview
+from rate_limit import DEFAULT_QUEUE, admission_context
+from result_cache import make_cache_key
+from singleflight import DEFAULT_FLIGHT
+
+# Draft mode: longest side of drafts, and how far the refine step may move away from them
+DRAFT_MAX_SIDE = int(os.getenv("DRAFT_MAX_SIDE", "512"))
+UPSCALE_STRENGTH = float(os.getenv("UPSCALE_STRENGTH", "0.35"))
+
+
+def generate_image(client, prompt, model, width=None, height=None, negative_prompt="",
+                   reference_image=None, strength=None, seed=None, cache=None, flight=DEFAULT_FLIGHT,
+                   similar=None, similar_threshold=None, on_preview=None):
+    """Run one text-to-image or image-to-image call, going through the result cache.
+
+    Image-to-image is used when reference_image (raw bytes) is given.
+    Returns (image, png_bytes, cache_hit), where cache_hit is False, "exact"
+    or "similar". Pass cache=None to bypass the cache. With a SimilarityIndex
+    as `similar`, unseeded text-to-image requests may also reuse the result
+    of a near-identical earlier prompt. Identical requests already in flight
+    are awaited instead of sent again.
+
+    on_preview(image_bytes) receives coarse previews of a text-to-image
+    call while it runs: partial images from backends that stream them,
+    otherwise a small few-step copy of the request (skipped while other
+    requests are queued).
+    """
+    key = make_cache_key(
+        model, prompt, negative_prompt,
+        width=width, height=height,
+        strength=strength, reference_image=reference_image, seed=seed
+    )
+    if reference_image is not None or seed is not None:
+        similar = None
+    group = (model, negative_prompt or "", width, height)
+
+    if cache is not None:
+        cached = cache.get(key)
+        hit = "exact"
+        if cached is None and similar is not None:
+            match = similar.lookup(prompt, group, similar_threshold)
+            if match is not None:
+                cached = cache.get(match[0])
+                hit = "similar"
+                if cached is None:
+                    similar.discard(match[0])
+        if cached is not None:
+            METRICS.inc("cache_hits" if hit == "exact" else "similar_hits", model=model)
+            if similar is not None and hit == "exact":
+                similar.add(prompt, group, key)
+            with METRICS.span("decode", model):
+                return decode_image(cached), cached, hit
+        METRICS.inc("cache_misses", model=model)
+
+    def call_model():
+        if reference_image is None:
+            sink = PreviewSink(on_preview) if on_preview is not None else None
+            if sink is not None and not _streams_previews(client, model) and not len(DEFAULT_QUEUE):
+                start_low_res_preview(client, sink, prompt, model, width, height, negative_prompt, seed)
+            try:
+                with preview_context(sink.stream if sink is not None else None):
+                    image = client.text_to_image(
+                        prompt=prompt,
+                        negative_prompt=negative_prompt or None,
+                        model=model,
+                        width=width,
+                        height=height,
+                        seed=seed
+                    )
+            finally:
+                if sink is not None:
+                    sink.finish()
+        else:
+            image = client.image_to_image(
+                image=reference_image,
+                prompt=prompt,
+                negative_prompt=negative_prompt or None,
+                model=model,
+                strength=strength,
+                seed=seed
+            )
+
+        with METRICS.span("encode", model):
+            png_bytes = encode_png(image)
+        # Size of our PNG re-encode; the client library hides the raw response payload
+        METRICS.inc("encoded_bytes", len(png_bytes), model)
+        if cache is not None:
+            cache.put(key, png_bytes)
+            if similar is not None:
+                similar.add(prompt, group, key)
+        return image, png_bytes
+
+    if flight is None:
+        image, png_bytes = call_model()
+    else:
+        (image, png_bytes), shared = flight.do(key, call_model)
+        if shared:
+            METRICS.inc("coalesced", model=model)
+    return image, png_bytes, False
+
+
+def _streams_previews(client, model):
+    streams = getattr(client, "streams_previews", None)
+    return bool(streams is not None and streams(model))
+
+
+def run_batch(client, jobs, cache=None, max_workers=BATCH_MAX_WORKERS):
+    """Run several generate_image calls concurrently on a bounded thread pool.
+
+    jobs is an iterable of keyword-argument dicts for generate_image; it is
+    consumed lazily, with at most max_workers calls in flight. Yields
+    (index, result, error) in completion order, where result is the
+    generate_image return value, or None when the call raised error.
+    """
+    jobs = iter(enumerate(jobs))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch") as pool:
+        in_flight = {}
+
+        def submit_next():
+            for index, job in jobs:
+                # Each job runs in a copy of the caller's context (admission session etc.)
+                future = pool.submit(contextvars.copy_context().run, generate_image, client, cache=cache, **job)
+                in_flight[future] = index
+                return True
+            return False
+
+        while len(in_flight) < max_workers and submit_next():
+            pass
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = in_flight.pop(future)
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+                submit_next()
+
+
+def generation_job(job, client, session_id=None, cache=None, previews=False, **kwargs):
+    """Background-job wrapper around generate_image that reports queue progress
+    (job.message) and, with previews=True, the latest preview (job.preview)."""
+    def on_preview(data):
+        job.preview = data
+
+    def on_wait(position, eta):
+        if position:
+            job.message = f"#{position} in queue, about {eta:.0f}s to start"
+        else:
+            job.message = "Generating"
+
+    with admission_context(session_id, on_wait=on_wait), \
+            METRICS.span("end_to_end", kwargs.get("model") or ""):
+        return generate_image(client, cache=cache, on_preview=on_preview if previews else None, **kwargs)
+
+
+def upscale_job(job, client, draft, width, height, strength=UPSCALE_STRENGTH, **kwargs):
+    """Background job promoting a draft: resize its bytes to width x height and
+    refine the result with an image-to-image call that uses it as reference."""
+    job.message = "Upscaling draft"
+    reference = upscale_reference(draft, width, height)
+    return generation_job(job, client, reference_image=reference, strength=strength, **kwargs)
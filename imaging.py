@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageOps, features
+
+from metrics import METRICS
+
+# History cards are a few hundred pixels wide, so thumbnails are sized to match
+THUMBNAIL_MAX_SIDE = int(os.getenv("THUMBNAIL_MAX_SIDE", "384"))
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP").upper()
+THUMBNAIL_CACHE_SIZE = 256
+
+# The SDXL refiner works around 1024px, so larger references are downscaled before upload
+REFERENCE_MAX_SIDE = int(os.getenv("REFERENCE_MAX_SIDE", "1024"))
+REFERENCE_QUALITY = 90
+
+# Download formats: label -> (Pillow format, file extension, MIME type)
+OUTPUT_FORMATS = {
+    "PNG": ("PNG", "png", "image/png"),
+    "PNG (palette)": ("PNG", "png", "image/png"),
+    "WebP": ("WEBP", "webp", "image/webp"),
+    "JPEG": ("JPEG", "jpg", "image/jpeg"),
+    "AVIF": ("AVIF", "avif", "image/avif"),
+}
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "PNG")
+OUTPUT_QUALITY = int(os.getenv("OUTPUT_QUALITY", "90"))
+# Pillow's default; generated images are stored and cached at this level
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))
+OUTPUT_CACHE_SIZE = int(os.getenv("OUTPUT_CACHE_SIZE", "32"))
+
+_thumbnail_cache = OrderedDict()  # content digest -> thumbnail bytes
+_thumbnail_lock = threading.Lock()
+_output_cache = OrderedDict()  # (content digest, settings) -> (encoded bytes, encode seconds)
+_output_lock = threading.Lock()
+
+
+def encode_png(image, compress_level=PNG_COMPRESS_LEVEL):
+    """Encode a PIL image to PNG bytes."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def decode_image(data):
+    """Decode encoded image bytes into a fully loaded PIL image."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def thumbnail_format():
+    """Return the thumbnail format to use, falling back to JPEG without WebP support."""
+    if THUMBNAIL_FORMAT == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return THUMBNAIL_FORMAT
+
+
+@lru_cache(maxsize=None)
+def output_formats():
+    """Labels of the OUTPUT_FORMATS this Pillow build can write (checked once)."""
+    # Unlike features.check(), this does not warn on builds that predate AVIF
+    modules = features.get_supported_modules()
+    return tuple(label for label, (fmt, _, _) in OUTPUT_FORMATS.items()
+                 if fmt not in ("WEBP", "AVIF") or fmt.lower() in modules)
+
+
+def encode_output(image, label=OUTPUT_FORMAT, quality=OUTPUT_QUALITY, compress_level=PNG_COMPRESS_LEVEL):
+    """Encode a PIL image in one of the OUTPUT_FORMATS.
+
+    quality applies to the lossy formats, compress_level to PNG. The palette
+    variant quantizes to 256 colours and lets Pillow optimize the file.
+    """
+    fmt = OUTPUT_FORMATS[label][0]
+    options = {}
+    if fmt == "PNG":
+        options["compress_level"] = compress_level
+        if label == "PNG (palette)":
+            image = image.convert("RGB").quantize(256)
+            options["optimize"] = True
+    else:
+        options["quality"] = quality
+        if fmt == "JPEG":
+            image = image.convert("RGB")
+            options.update(optimize=True, progressive=True)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def cached_output(data, label=OUTPUT_FORMAT, quality=OUTPUT_QUALITY, compress_level=PNG_COMPRESS_LEVEL, image=None):
+    """Return (encoded bytes, encode seconds) for stored PNG bytes in an output format.
+
+    Each image is encoded once per setting; plain PNG at the storage level
+    is returned as is.
+    """
+    if label == "PNG" and compress_level == PNG_COMPRESS_LEVEL:
+        return data, 0.0
+
+    settings = (label, quality) if OUTPUT_FORMATS[label][0] != "PNG" else (label, compress_level)
+    key = (hashlib.sha256(data).hexdigest(), settings)
+    with _output_lock:
+        if key in _output_cache:
+            _output_cache.move_to_end(key)
+            return _output_cache[key]
+
+    extension = OUTPUT_FORMATS[label][1]
+    started = time.perf_counter()
+    encoded = encode_output(image if image is not None else decode_image(data), label, quality, compress_level)
+    seconds = time.perf_counter() - started
+    METRICS.observe(f"encode_{extension}", seconds)
+    METRICS.inc(f"output_bytes_{extension}", len(encoded))
+
+    with _output_lock:
+        _output_cache[key] = (encoded, seconds)
+        while len(_output_cache) > OUTPUT_CACHE_SIZE:
+            _output_cache.popitem(last=False)
+    return encoded, seconds
+
+
+def make_thumbnail(image, max_side=THUMBNAIL_MAX_SIDE, quality=THUMBNAIL_QUALITY):
+    """Return a card-sized WebP/JPEG preview of a PIL image as bytes."""
+    thumb = image.copy()
+    thumb.thumbnail((max_side, max_side), Image.LANCZOS)
+    if thumb.mode != "RGB":
+        thumb = thumb.convert("RGB")
+    buffer = io.BytesIO()
+    thumb.save(buffer, format=thumbnail_format(), quality=quality)
+    return buffer.getvalue()
+
+
+def cached_thumbnail(data, image=None):
+    """Return the thumbnail for encoded image bytes, building it once per image.
+
+    Thumbnails are cached by content digest, so the same image coming back
+    from the result cache or another session reuses the existing thumbnail.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    with _thumbnail_lock:
+        if digest in _thumbnail_cache:
+            _thumbnail_cache.move_to_end(digest)
+            return _thumbnail_cache[digest]
+
+    with METRICS.span("thumbnail"):
+        thumbnail = make_thumbnail(image if image is not None else decode_image(data))
+    with _thumbnail_lock:
+        _thumbnail_cache[digest] = thumbnail
+        while len(_thumbnail_cache) > THUMBNAIL_CACHE_SIZE:
+            _thumbnail_cache.popitem(last=False)
+    return thumbnail
+
+
+def upscale_reference(data, width, height, quality=REFERENCE_QUALITY):
+    """Resize a draft to its full target size as the reference for the refine step."""
+    with METRICS.span("upscale_reference"):
+        image = decode_image(data).convert("RGB").resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+
+def prepare_reference(data, max_side=REFERENCE_MAX_SIDE, quality=REFERENCE_QUALITY):
+    """Decode an uploaded reference image once, fix its EXIF orientation,
+    downscale it to the model's working size and re-encode it as JPEG."""
+    with METRICS.span("prepare_reference"):
+        return _prepare_reference(data, max_side, quality)
+
+
+def _prepare_reference(data, max_side, quality):
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
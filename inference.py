@@ -0,0 +1,233 @@
+import base64
+import json
+import os
+import threading
+
+import huggingface_hub
+from huggingface_hub import InferenceClient
+
+from imaging import decode_image
+from previews import PREVIEW_PARTIAL_IMAGES, current_preview_callback
+from rate_limit import RATE_LIMIT_BURST, AdmissionQueue, AdmittedClient, DEFAULT_QUEUE, make_bucket
+from retry import RetryingClient, RetryPolicy
+from router import Backend, BackendRouter
+
+# Keep-alive pool shared by every InferenceClient in the process
+POOL_MAX_CONNECTIONS = int(os.getenv("HF_POOL_MAX_CONNECTIONS", "32"))
+POOL_KEEPALIVE_SECONDS = float(os.getenv("HF_POOL_KEEPALIVE_SECONDS", "120"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("HF_REQUEST_TIMEOUT_SECONDS", "0")) or None
+WARMUP_URL = os.getenv("HF_WARMUP_URL", "https://router.huggingface.co")
+# Send every request to one endpoint instead (dedicated endpoint or a local stub)
+INFERENCE_BASE_URL = os.getenv("HF_INFERENCE_BASE_URL")
+# JSON list of backends for the router, e.g.
+# [{"name": "serverless", "kind": "hf"}, {"name": "local", "kind": "openai", "url": "http://127.0.0.1:8765"}]
+INFERENCE_BACKENDS = os.getenv("INFERENCE_BACKENDS")
+# With several backends, give up on one quickly and fail over instead
+FAILOVER_MAX_ATTEMPTS = int(os.getenv("HF_FAILOVER_MAX_ATTEMPTS", "2"))
+FAILOVER_MAX_LOAD_WAIT = float(os.getenv("HF_FAILOVER_MAX_LOAD_WAIT", "5"))
+
+_pool_configured = False
+_pool_lock = threading.Lock()
+
+
+def configure_connection_pool():
+    """Install a keep-alive connection pool for huggingface_hub (once per process)."""
+    global _pool_configured
+    with _pool_lock:
+        if _pool_configured:
+            return
+        _pool_configured = True
+
+        if hasattr(huggingface_hub, "set_client_factory"):
+            # huggingface_hub >= 1.0 shares one httpx client per process
+            try:
+                import httpx2 as httpx
+            except ImportError:
+                import httpx
+
+            # Keep the library's request hooks (request IDs, offline mode checks)
+            event_hooks = huggingface_hub.get_session().event_hooks
+            limits = httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_CONNECTIONS,
+                keepalive_expiry=POOL_KEEPALIVE_SECONDS,
+            )
+
+            def client_factory():
+                return httpx.Client(
+                    event_hooks=event_hooks,
+                    follow_redirects=True,
+                    timeout=None,
+                    limits=limits,
+                )
+
+            huggingface_hub.set_client_factory(client_factory)
+        else:
+            # Older releases use requests; size the adapter pool instead
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            def backend_factory():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAX_CONNECTIONS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                return session
+
+            huggingface_hub.configure_http_backend(backend_factory=backend_factory)
+
+
+def warm_up(url=WARMUP_URL):
+    """Open a pooled connection (and TLS session) to the inference host in the background."""
+    def _run():
+        try:
+            huggingface_hub.get_session().head(url, timeout=10)
+        except Exception:
+            # Warm-up is best effort; the first real request will connect instead
+            pass
+
+    thread = threading.Thread(target=_run, name="hf-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class FixedEndpointClient:
+    """Sends every call to the client's base_url, whatever model is requested.
+
+    InferenceClient ignores base_url when a model is passed, so the model
+    argument is dropped here (after metrics and caching have used it).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def text_to_image(self, **kwargs):
+        kwargs.pop("model", None)
+        return self.client.text_to_image(**kwargs)
+
+    def image_to_image(self, **kwargs):
+        kwargs.pop("model", None)
+        return self.client.image_to_image(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class OpenAIImagesClient:
+    """Text-to-image client for OpenAI-compatible /v1/images/generations servers.
+
+    When a preview callback is set (see previews.preview_context), partial
+    images are requested as a server-sent event stream and passed on.
+    """
+
+    def __init__(self, base_url, token=None, timeout=None):
+        self.url = base_url.rstrip("/") + "/v1/images/generations"
+        self.token = token
+        self.timeout = timeout
+
+    def text_to_image(self, prompt, model=None, width=None, height=None, negative_prompt=None, seed=None,
+                      num_inference_steps=None):
+        payload = {"prompt": prompt, "n": 1, "response_format": "b64_json"}
+        if model:
+            payload["model"] = model
+        if width and height:
+            payload["size"] = f"{width}x{height}"
+        # Not part of the OpenAI API, but accepted by most local servers
+        if negative_prompt:
+            payload["negative_prompt"] = negative_prompt
+        if seed is not None:
+            payload["seed"] = seed
+        if num_inference_steps is not None:
+            payload["steps"] = num_inference_steps
+
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        on_preview = current_preview_callback()
+        if on_preview is not None and PREVIEW_PARTIAL_IMAGES:
+            payload.update(stream=True, partial_images=PREVIEW_PARTIAL_IMAGES)
+            return self._stream(payload, headers, on_preview)
+
+        response = huggingface_hub.get_session().post(self.url, json=payload, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return decode_image(base64.b64decode(response.json()["data"][0]["b64_json"]))
+
+    def _stream(self, payload, headers, on_preview):
+        session = huggingface_hub.get_session()
+        if hasattr(session, "stream"):
+            # httpx (huggingface_hub >= 1.0)
+            with session.stream("POST", self.url, json=payload, headers=headers, timeout=self.timeout) as response:
+                response.raise_for_status()
+                return self._read_events(response.iter_lines(), on_preview)
+        with session.post(self.url, json=payload, headers=headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            return self._read_events(response.iter_lines(decode_unicode=True), on_preview)
+
+    def _read_events(self, lines, on_preview):
+        for line in lines:
+            if not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            data = base64.b64decode(event["b64_json"]) if event.get("b64_json") else None
+            if event.get("type") == "image_generation.partial_image" and data:
+                on_preview(data)
+            elif event.get("type") == "image_generation.completed" and data:
+                return decode_image(data)
+        raise RuntimeError("Image stream ended without a completed image")
+
+
+def backend_specs(base_url=INFERENCE_BASE_URL):
+    """Backend definitions from INFERENCE_BACKENDS, or the single default backend."""
+    if INFERENCE_BACKENDS:
+        return json.loads(INFERENCE_BACKENDS)
+    if base_url:
+        return [{"name": "endpoint", "kind": "endpoint", "url": base_url}]
+    return [{"name": "serverless", "kind": "hf"}]
+
+
+def make_backend(spec, token, policy=None):
+    """Build one router Backend from a spec dict.
+
+    Keys: name, kind ("hf", "endpoint" or "openai"), url, models (model IDs
+    served, default all), token_env (env var holding its token) and
+    rate_per_minute (own admission budget instead of the shared one).
+    """
+    kind = spec.get("kind", "hf")
+    if spec.get("token_env"):
+        token = os.getenv(spec["token_env"])
+    if kind == "hf":
+        inner = InferenceClient(token=token, timeout=REQUEST_TIMEOUT_SECONDS)
+    elif kind == "endpoint":
+        inner = FixedEndpointClient(InferenceClient(base_url=spec["url"], token=token, timeout=REQUEST_TIMEOUT_SECONDS))
+    elif kind == "openai":
+        inner = OpenAIImagesClient(spec["url"], token=token, timeout=REQUEST_TIMEOUT_SECONDS)
+    else:
+        raise ValueError(f"unknown backend kind {kind!r}")
+
+    queue = DEFAULT_QUEUE
+    if spec.get("rate_per_minute"):
+        queue = AdmissionQueue(make_bucket(f"backend:{spec.get('name', kind)}", float(spec["rate_per_minute"]) / 60.0, RATE_LIMIT_BURST))
+    return Backend(
+        spec.get("name", kind),
+        RetryingClient(AdmittedClient(inner, queue), policy=policy),
+        models=spec.get("models"),
+        image_to_image=kind != "openai",
+        previews=kind == "openai",
+    )
+
+
+def create_client(token, warm=True, base_url=INFERENCE_BASE_URL, specs=None):
+    """Create a routed inference client that uses the shared connection pool.
+
+    Every backend waits its turn in an admission queue and retries
+    rate-limited or cold-model responses; with several backends each call
+    goes to the fastest healthy one and fails over to the others.
+    """
+    configure_connection_pool()
+    specs = specs or backend_specs(base_url)
+    policy = None
+    if len(specs) > 1:
+        policy = RetryPolicy(max_attempts=FAILOVER_MAX_ATTEMPTS, max_load_wait=FAILOVER_MAX_LOAD_WAIT)
+    client = BackendRouter(make_backend(spec, token, policy) for spec in specs)
+    if warm and WARMUP_URL:
+        for spec in specs:
+            warm_up(spec.get("url") or WARMUP_URL)
+    return client
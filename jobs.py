@@ -0,0 +1,295 @@
+import base64
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import QueueFullError
+from shared_state import SHARED_STATE
+
+# Worker threads shared by every session of the process
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "8"))
+# Concurrent inference calls per batch: jobs running at once for one session
+# (and the default batch_cli --concurrency)
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+# Jobs allowed to wait for a worker, in total and per session
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_MAX_QUEUED_PER_SESSION = int(os.getenv("JOB_MAX_QUEUED_PER_SESSION", "16"))
+# Finished jobs nobody collected are dropped after this many seconds
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "900"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class RemoteJobError(Exception):
+    """A job that failed on another replica; `kind` is the original exception class name."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _dump(value):
+    # JSON-safe copy of a job result: bytes are base64-encoded, other objects (images) dropped
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _dump(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return None
+
+
+def _load(value):
+    if isinstance(value, list):
+        return tuple(_load(item) for item in value)
+    if isinstance(value, dict):
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _load(item) for key, item in value.items()}
+    return value
+
+
+class Job:
+    """State of one background job. `message` holds progress text for the UI,
+    `preview` the latest preview image bytes, if any."""
+
+    def __init__(self, meta, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.meta = meta or {}
+        self.status = QUEUED
+        self._message = ""
+        self._preview = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._on_change = on_change
+
+    @property
+    def is_finished(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def message(self):
+        return self._message
+
+    @message.setter
+    def message(self, value):
+        self._message = value
+        if self._on_change is not None:
+            self._on_change(self)
+
+    @property
+    def preview(self):
+        return self._preview
+
+    @preview.setter
+    def preview(self, value):
+        self._preview = value
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def snapshot(self):
+        """JSON text of the job's state for other replicas."""
+        error = None
+        if self.error is not None:
+            error = {"kind": type(self.error).__name__, "message": str(self.error)}
+        return json.dumps({
+            "id": self.id, "meta": _dump(self.meta), "status": self.status, "message": self._message,
+            "preview": _dump(self._preview), "result": _dump(self.result), "error": error,
+            "created": self.created, "finished": self.finished,
+        })
+
+    @classmethod
+    def from_snapshot(cls, text):
+        data = json.loads(text)
+        job = cls(_load(data["meta"]))
+        job.id = data["id"]
+        job.status = data["status"]
+        job._message = data["message"]
+        job._preview = _load(data["preview"])
+        job.result = _load(data["result"])
+        if data["error"] is not None:
+            job.error = RemoteJobError(data["error"]["kind"], data["error"]["message"])
+        job.created = data["created"]
+        job.finished = data["finished"]
+        return job
+
+
+class JobManager:
+    """Runs jobs on a process-owned thread pool so script threads never block
+    on inference. Jobs are looked up by ID from any session.
+
+    Jobs wait in per-session queues and are handed to free workers round-robin
+    across sessions, with at most max_per_session running for one session, so
+    one session's batch cannot hold every worker while others wait behind it.
+    Submitting raises QueueFullError once max_queued jobs (or
+    max_queued_per_session for that session) are waiting, and waiting jobs
+    show their place in line as their message.
+
+    With a shared state store, job status, progress and results are also
+    published there, so a session that moves to another replica can still
+    follow and collect its jobs (results keep bytes only, not images).
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, ttl=JOB_TTL_SECONDS, shared=SHARED_STATE,
+                 max_per_session=BATCH_MAX_WORKERS, max_queued=JOB_MAX_QUEUED,
+                 max_queued_per_session=JOB_MAX_QUEUED_PER_SESSION):
+        self.ttl = ttl
+        self.shared = shared
+        self.max_workers = max(1, max_workers)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._waiting = OrderedDict()  # session -> deque of queued calls, next session to serve first
+        self._running = Counter()  # session -> running jobs
+        self._average_seconds = None  # moving average of job run time, for queue ETAs
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, meta=None, **kwargs):
+        """Run func(job, *args, **kwargs) in the background and return the job ID.
+
+        A session_id keyword argument (passed on to func) decides which
+        session's queue the job waits in.
+        """
+        job = Job(meta, on_change=self._publish if self.shared is not None else None)
+        session_id = kwargs.get("session_id")
+        call = (job, func, args, kwargs, contextvars.copy_context())
+        with self._lock:
+            self._prune()
+            waiting = self._waiting.get(session_id, ())
+            if (len(waiting) >= self.max_queued_per_session
+                    or sum(len(queue) for queue in self._waiting.values()) >= self.max_queued):
+                raise QueueFullError("Too many queued jobs, please try again shortly")
+            self._jobs[job.id] = job
+            self._waiting.setdefault(session_id, deque()).append(call)
+        self._publish(job)
+        self._dispatch()
+        return job.id
+
+    def _dispatch(self):
+        # Hand queued jobs to free workers, one session at a time in turn
+        with self._lock:
+            while sum(self._running.values()) < self.max_workers:
+                session_id = next(
+                    (s for s in self._waiting if self._running[s] < self.max_per_session), _NO_SESSION
+                )
+                if session_id is _NO_SESSION:
+                    break
+                queue = self._waiting.pop(session_id)
+                job, func, args, kwargs, context = queue.popleft()
+                if queue:
+                    # Back of the line until every other waiting session had a turn
+                    self._waiting[session_id] = queue
+                self._running[session_id] += 1
+                self._pool.submit(context.run, self._run, session_id, job, func, args, kwargs)
+            changed = self._update_queue_messages()
+        for job in changed:
+            self._publish(job)
+
+    def _update_queue_messages(self):
+        # Give every waiting job its place in the round-robin order and an ETA;
+        # returns the jobs whose message changed, to publish outside the lock
+        changed = []
+        queues = list(self._waiting.values())
+        position = 0
+        for index in range(max(map(len, queues), default=0)):
+            for queue in queues:
+                if index >= len(queue):
+                    continue
+                position += 1
+                job = queue[index][0]
+                message = f"#{position} in queue"
+                if self._average_seconds is not None:
+                    turns = max(-(-position // self.max_workers), index // self.max_per_session + 1)
+                    message += f", about {turns * self._average_seconds:.0f}s to start"
+                if message != job._message:
+                    job._message = message
+                    changed.append(job)
+        return changed
+
+    def _run(self, session_id, job, func, args, kwargs):
+        job.status = RUNNING
+        job.message = ""
+        started = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            self._publish(job)
+            with self._lock:
+                elapsed = job.finished - started
+                if self._average_seconds is None:
+                    self._average_seconds = elapsed
+                else:
+                    self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+                self._running[session_id] -= 1
+                if not self._running[session_id]:
+                    del self._running[session_id]
+            self._dispatch()
+
+    def _publish(self, job):
+        if self.shared is None:
+            return
+        try:
+            self.shared.set("job:" + job.id, job.snapshot().encode("utf-8"), ttl=self.ttl)
+        except Exception:
+            # Best effort: the job still runs and is collected on this replica
+            pass
+
+    def get(self, job_id):
+        """Return the job, looking it up in the shared store when another replica runs it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.shared is None:
+            return job
+        try:
+            text = self.shared.get("job:" + job_id)
+        except Exception:
+            return None
+        return Job.from_snapshot(text) if text is not None else None
+
+    def discard(self, job_id):
+        """Forget a job once its result has been collected."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        if self.shared is not None:
+            try:
+                self.shared.delete("job:" + job_id)
+            except Exception:
+                pass
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+# Marks "no session can start a job now" (None is a valid session ID)
+_NO_SESSION = object()
+
+DEFAULT_JOBS = JobManager()
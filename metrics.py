@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Samples kept per (stage, model) for percentile estimates
+MAX_SAMPLES = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "image_gen"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Metrics:
+    """Process-wide timing spans and counters, labelled by model.
+
+    Optionally appends every observation to a JSONL log.
+    """
+
+    def __init__(self, log_path=None, max_samples=MAX_SAMPLES):
+        self.log_path = log_path
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._totals = defaultdict(lambda: [0, 0.0])  # (stage, model) -> [count, sum]
+        self._counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, model=""):
+        with self._lock:
+            self._samples[(stage, model)].append(seconds)
+            totals = self._totals[(stage, model)]
+            totals[0] += 1
+            totals[1] += seconds
+        self._log({"type": "span", "stage": stage, "model": model, "seconds": round(seconds, 6)})
+
+    def inc(self, name, value=1, model=""):
+        with self._lock:
+            self._counters[(name, model)] += value
+        self._log({"type": "counter", "name": name, "model": model, "value": value})
+
+    @contextmanager
+    def span(self, stage, model=""):
+        """Time the enclosed block as one observation of `stage`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, model)
+
+    def summary(self):
+        """Per (stage, model) count and p50/p95/p99 in milliseconds."""
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._samples.items()}
+            totals = {key: list(value) for key, value in self._totals.items()}
+        rows = []
+        for (stage, model), values in sorted(snapshot.items()):
+            row = {"stage": stage, "model": model, "count": totals[(stage, model)][0]}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_ms"] = round(percentile(values, q) * 1000, 1)
+            rows.append(row)
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return {f"{name}{{{model}}}" if model else name: value for (name, model), value in sorted(self._counters.items())}
+
+    def prometheus_text(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._samples.items()}
+            totals = {key: list(value) for key, value in self._totals.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds Time spent per request stage.",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+        ]
+        for (stage, model), values in sorted(snapshot.items()):
+            labels = f'stage="{stage}",model="{model}"'
+            for q in QUANTILES:
+                lines.append(f'{METRIC_PREFIX}_stage_seconds{{{labels},quantile="{q}"}} {percentile(values, q):.6f}')
+            count, total = totals[(stage, model)]
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_count{{{labels}}} {count}")
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{{{labels}}} {total:.6f}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            for (counter_name, model), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f'{METRIC_PREFIX}_{name}_total{{model="{model}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def _log(self, record):
+        if not self.log_path:
+            return
+        record["ts"] = time.time()
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+METRICS = Metrics(log_path=os.getenv("METRICS_LOG"))
+
+
+def start_metrics_server(port, metrics=METRICS, host="0.0.0.0"):
+    """Serve metrics.prometheus_text() at /metrics from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
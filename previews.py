@@ -0,0 +1,106 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from imaging import make_thumbnail
+from metrics import METRICS
+
+# Low-resolution preview requests for backends that cannot stream partial images
+PREVIEW_MAX_SIDE = int(os.getenv("PREVIEW_MAX_SIDE", "384"))
+PREVIEW_STEPS = int(os.getenv("PREVIEW_STEPS", "2"))
+# Partial images requested from backends that stream them (OpenAI-style)
+PREVIEW_PARTIAL_IMAGES = int(os.getenv("PREVIEW_PARTIAL_IMAGES", "2"))
+
+# on_preview(image_bytes) of the request running in the current context
+_current_preview = ContextVar("preview_callback", default=None)
+# Set while a low-resolution preview request runs, so its latency stays out of
+# backend routing scores and the inference timings
+_preview_request = ContextVar("preview_request", default=False)
+
+
+@contextmanager
+def preview_context(on_preview):
+    """Deliver intermediate images of inference calls made in this context to on_preview."""
+    token = _current_preview.set(on_preview)
+    try:
+        yield
+    finally:
+        _current_preview.reset(token)
+
+
+def current_preview_callback():
+    return _current_preview.get()
+
+
+def is_preview_request():
+    return _preview_request.get()
+
+
+def preview_size(width, height, max_side=PREVIEW_MAX_SIDE):
+    """Scale (width, height) down to max_side, keeping multiples of 16."""
+    width, height = width or 1024, height or 1024
+    scale = min(1.0, max_side / max(width, height))
+    return max(64, int(width * scale) // 16 * 16), max(64, int(height * scale) // 16 * 16)
+
+
+class PreviewSink:
+    """Forwards preview images to a callback until the final image is ready.
+
+    Streamed partial images take precedence over the low-resolution preview.
+    """
+
+    def __init__(self, on_preview):
+        self.on_preview = on_preview
+        self.streamed = False
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def stream(self, data):
+        with self._lock:
+            if self._finished:
+                return
+            self.streamed = True
+            self.on_preview(data)
+        METRICS.inc("previews")
+
+    def low_res(self, data):
+        with self._lock:
+            if self._finished or self.streamed:
+                return
+            self.on_preview(data)
+        METRICS.inc("previews")
+
+    def finish(self):
+        with self._lock:
+            self._finished = True
+
+
+def start_low_res_preview(client, sink, prompt, model, width, height, negative_prompt="", seed=None):
+    """Send a small, few-step copy of a text-to-image request in the background
+    and pass the result to sink.low_res. Failures are ignored."""
+    preview_width, preview_height = preview_size(width, height)
+
+    def run():
+        _preview_request.set(True)
+        try:
+            # The preview itself must not stream into the sink
+            with preview_context(None):
+                image = client.text_to_image(
+                    prompt=prompt,
+                    negative_prompt=negative_prompt or None,
+                    model=model,
+                    width=preview_width,
+                    height=preview_height,
+                    seed=seed,
+                    num_inference_steps=PREVIEW_STEPS
+                )
+            sink.low_res(make_thumbnail(image, max_side=PREVIEW_MAX_SIDE))
+        except Exception:
+            # Previews are best effort; the full request reports real errors
+            pass
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name="preview", daemon=True)
+    thread.start()
+    return thread
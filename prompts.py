@@ -0,0 +1,52 @@
+from functools import lru_cache
+from itertools import product
+
+from config import (
+    CAMERA_STYLES, DETAIL_LEVELS, LIGHTING_STYLES, QUALITY_BOOSTERS, REALISM_LEVELS,
+    REALISM_PROMPTS, STYLE_PROMPTS
+)
+
+
+def _build_suffix(realism, lighting, detail, camera, style):
+    enhancements = []
+
+    # Add style preset
+    if style != "None":
+        enhancements.append(STYLE_PROMPTS[style])
+
+    if REALISM_PROMPTS[realism]:
+        enhancements.append(REALISM_PROMPTS[realism])
+
+    for option in (lighting, detail, camera):
+        if option != "Default":
+            enhancements.append(option.lower())
+
+    # Always add quality boosters
+    enhancements.append(QUALITY_BOOSTERS)
+
+    return ", ".join(enhancements)
+
+
+# Every (realism, lighting, detail, camera, style) suffix, built once per process
+# on first use rather than at import, to keep it off the first page render
+@lru_cache(maxsize=1)
+def prompt_suffixes():
+    return {
+        combination: _build_suffix(*combination)
+        for combination in product(REALISM_LEVELS, LIGHTING_STYLES, DETAIL_LEVELS, CAMERA_STYLES, STYLE_PROMPTS)
+    }
+
+
+# Build enhanced prompt function
+def enhance_prompt(base_prompt, realism, lighting, detail, camera, style):
+    return f"{base_prompt}, {prompt_suffixes()[(realism, lighting, detail, camera, style)]}"
+
+
+def clean_negative_prompt(negative):
+    """Normalize a negative prompt: one comma-separated list without blanks or repeats."""
+    terms = []
+    for term in negative.replace("\n", ",").split(","):
+        term = " ".join(term.split())
+        if term and term not in terms:
+            terms.append(term)
+    return ", ".join(terms)
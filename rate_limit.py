@@ -0,0 +1,210 @@
+import bisect
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metrics import METRICS
+from previews import is_preview_request
+from shared_state import SHARED_STATE
+
+# Process-wide budget for the shared HUGGINGFACE_TOKEN
+RATE_LIMIT_PER_MINUTE = float(os.getenv("HF_RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("HF_RATE_LIMIT_BURST", "5"))
+MAX_QUEUED_REQUESTS = int(os.getenv("HF_MAX_QUEUED_REQUESTS", "100"))
+
+# (session_id, on_wait) of the request running in the current context
+_current_request = ContextVar("admission_request", default=(None, None))
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue has no room for another request."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available. Returns 0, or seconds until the next token."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def eta(self, count):
+        """Seconds until `count` tokens will have been available."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (count - self._tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """TokenBucket backed by the shared state store, so every replica draws
+    from one budget. Falls back to a local bucket while the store is unreachable."""
+
+    def __init__(self, store, name, rate, burst):
+        self.store = store
+        self.name = name
+        self.local = TokenBucket(rate, burst)
+
+    @property
+    def rate(self):
+        return self.local.rate
+
+    @rate.setter
+    def rate(self, value):
+        self.local.rate = value
+
+    @property
+    def burst(self):
+        return self.local.burst
+
+    def try_acquire(self):
+        try:
+            return self.store.acquire(self.name, self.rate, self.burst)
+        except Exception:
+            METRICS.inc("shared_state_errors")
+            return self.local.try_acquire()
+
+    def eta(self, count):
+        try:
+            return self.store.eta(self.name, self.rate, self.burst, count)
+        except Exception:
+            METRICS.inc("shared_state_errors")
+            return self.local.eta(count)
+
+
+def make_bucket(name, rate, burst, store=SHARED_STATE):
+    """A token bucket shared by all replicas when SHARED_STATE_URL is set, else a local one."""
+    if store is not None:
+        return SharedTokenBucket(store, name, rate, burst)
+    return TokenBucket(rate, burst)
+
+
+class AdmissionQueue:
+    """Bounded FIFO in front of the token bucket with per-session fairness.
+
+    A session's n-th waiting request is queued behind every other session's
+    (n-1)-th, so one user submitting a batch cannot starve the others.
+    """
+
+    def __init__(self, bucket, max_waiting=MAX_QUEUED_REQUESTS, poll_interval=0.5):
+        self.bucket = bucket
+        self.max_waiting = max_waiting
+        self.poll_interval = poll_interval
+        self._waiting = []  # sorted (round, sequence, session_id) tickets
+        self._rounds = {}  # session_id -> waiting requests of that session
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._waiting)
+
+    def admit(self, session_id=None, on_wait=None):
+        """Block until this request may be sent.
+
+        on_wait(position, eta_seconds) is called from the waiting thread
+        while the request is queued; position 1 is the head of the queue.
+        After waiting, it is called once more with position 0 on admission.
+        """
+        with self._cond:
+            if len(self._waiting) >= self.max_waiting:
+                raise QueueFullError("Too many queued requests, please try again shortly")
+            round_ = self._rounds.get(session_id, 0)
+            self._rounds[session_id] = round_ + 1
+            ticket = (round_, next(self._sequence), session_id)
+            bisect.insort(self._waiting, ticket)
+
+        waited = False
+        try:
+            while True:
+                with self._cond:
+                    position = self._waiting.index(ticket)
+                    if position == 0:
+                        wait = self.bucket.try_acquire()
+                        if wait == 0:
+                            break
+                    else:
+                        wait = self.poll_interval
+
+                # Outside the lock: with a shared bucket this is a store round trip
+                if on_wait is not None:
+                    on_wait(position + 1, self.bucket.eta(position + 1))
+                    waited = True
+
+                with self._cond:
+                    self._cond.wait(min(wait, self.poll_interval))
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                self._rounds[session_id] -= 1
+                if not self._rounds[session_id]:
+                    del self._rounds[session_id]
+                self._cond.notify_all()
+
+        if waited:
+            on_wait(0, 0.0)
+
+
+DEFAULT_QUEUE = AdmissionQueue(make_bucket("hf_token", RATE_LIMIT_PER_MINUTE / 60.0, RATE_LIMIT_BURST))
+
+
+@contextmanager
+def admission_context(session_id, on_wait=None):
+    """Tag inference calls made in this context with a session and a wait callback."""
+    token = _current_request.set((session_id, on_wait))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+class AdmittedClient:
+    """Wraps an InferenceClient so every generation call passes the admission queue."""
+
+    def __init__(self, client, queue=DEFAULT_QUEUE):
+        self.client = client
+        self.queue = queue
+
+    def _call(self, method, kwargs):
+        model = kwargs.get("model") or ""
+        session_id, on_wait = _current_request.get()
+        with METRICS.span("queue", model):
+            self.queue.admit(session_id, on_wait)
+
+        # Request payload: prompt text plus any reference image
+        sent = len((kwargs.get("prompt") or "").encode("utf-8"))
+        if isinstance(kwargs.get("image"), (bytes, bytearray)):
+            sent += len(kwargs["image"])
+        METRICS.inc("bytes_out", sent, model)
+
+        # Preview requests are timed separately so they do not skew inference p50/p95
+        with METRICS.span("preview" if is_preview_request() else "inference", model):
+            return getattr(self.client, method)(**kwargs)
+
+    def text_to_image(self, **kwargs):
+        return self._call("text_to_image", kwargs)
+
+    def image_to_image(self, **kwargs):
+        return self._call("image_to_image", kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from shared_state import SHARED_STATE
+
+# Default cache location and size limit (override with env vars)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "results")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = ".img"
+# How long results stay in the shared store (SHARED_STATE_URL)
+SHARED_RESULT_TTL_SECONDS = int(os.getenv("SHARED_RESULT_TTL_SECONDS", "86400"))
+# Total size of results kept in the shared store; the oldest are dropped beyond it
+SHARED_RESULT_MAX_BYTES = int(os.getenv("SHARED_RESULT_MAX_MB", "256")) * 1024 * 1024
+SHARED_RESULT_PREFIX = "result:"
+
+
+def make_cache_key(model, prompt, negative_prompt="", width=None, height=None,
+                   strength=None, reference_image=None, seed=None):
+    """Build a content-addressed key for one generation request."""
+    reference_digest = None
+    if reference_image is not None:
+        reference_digest = hashlib.sha256(reference_image).hexdigest()
+
+    payload = json.dumps({
+        "model": model,
+        "prompt": prompt,
+        "negative_prompt": negative_prompt or "",
+        "width": width,
+        "height": height,
+        "strength": strength,
+        "reference": reference_digest,
+        "seed": seed,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """On-disk cache of encoded generation results with size-bounded LRU eviction.
+
+    Safe to share between Streamlit sessions of the same process.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.getenv("RESULT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(os.getenv("RESULT_CACHE_MAX_MB", "0")) * 1024 * 1024 or DEFAULT_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+    def _load_index(self):
+        # Rebuild the LRU order from file access times left by earlier processes
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            found.append((stat.st_mtime, name[:-len(CACHE_FILE_SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key):
+        """Return the cached bytes for key, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                # File removed behind our back - treat as a miss
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store encoded bytes under key, evicting old entries if over budget."""
+        if len(data) > self.max_bytes:
+            return
+        tmp_path = self._path(key) + ".tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class SharedResultCache:
+    """This replica's on-disk ResultCache in front of the shared state store,
+    so a result generated by any replica is reused by all of them.
+
+    The shared store is best effort: when it is unreachable the local cache
+    keeps working on its own. Shared entries are capped at max_bytes in
+    total, like the local cache's RESULT_CACHE_MAX_MB.
+    """
+
+    def __init__(self, local, store, ttl=SHARED_RESULT_TTL_SECONDS, max_bytes=SHARED_RESULT_MAX_BYTES):
+        self.local = local
+        self.store = store
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.shared_hits = 0
+
+    def get(self, key):
+        data = self.local.get(key)
+        if data is not None:
+            return data
+        try:
+            data = self.store.get(SHARED_RESULT_PREFIX + key)
+        except Exception:
+            return None
+        if data is not None:
+            self.shared_hits += 1
+            self.local.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.local.put(key, data)
+        try:
+            self.store.set_bounded(SHARED_RESULT_PREFIX + key, data, self.ttl, SHARED_RESULT_PREFIX, self.max_bytes)
+        except Exception:
+            pass
+
+    def clear(self):
+        # Shared entries expire on their own
+        self.local.clear()
+
+    def stats(self):
+        stats = self.local.stats()
+        # Local misses served by the shared store count as hits
+        stats["hits"] += self.shared_hits
+        stats["misses"] -= self.shared_hits
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+
+def create_result_cache(store=SHARED_STATE):
+    """The result cache for this process: shared between replicas when SHARED_STATE_URL is set."""
+    local = ResultCache()
+    return SharedResultCache(local, store) if store is not None else local
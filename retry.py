@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import threading
+import time
+
+from metrics import METRICS
+
+# Status codes worth retrying automatically
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Exception class names raised by requests/httpx for dropped or slow connections
+TRANSIENT_ERROR_NAMES = {
+    "ConnectionError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+    "ReadError", "RemoteProtocolError", "Timeout", "TimeoutException",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference service unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a total deadline."""
+
+    def __init__(self, max_attempts=None, base_delay=1.0, max_delay=30.0,
+                 deadline=None, max_load_wait=60.0):
+        self.max_attempts = max_attempts or int(os.getenv("HF_RETRY_MAX_ATTEMPTS", "5"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline or float(os.getenv("HF_RETRY_DEADLINE_SECONDS", "120"))
+        self.max_load_wait = max_load_wait
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def delay_for(self, error, attempt):
+        """Seconds to wait before the next attempt, honouring server hints."""
+        response = getattr(error, "response", None)
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        load_time = _estimated_load_time(response)
+        if load_time is not None:
+            return min(load_time, self.max_load_wait)
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    """Per-process breaker that fails fast after repeated transient failures."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - self._clock()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            # Half-open: let this call through as a trial
+            self._opened_at = None
+            self._failures = self.failure_threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+def is_retryable(error):
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def call_with_retry(func, policy, breaker=None, sleep=time.sleep, clock=time.monotonic, on_retry=None):
+    """Call func(), retrying transient failures according to policy.
+
+    on_retry(error, delay) is called before each wait.
+    """
+    started = clock()
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            # Waiting for a cold model to load is expected, not a backend failure
+            loading = _estimated_load_time(getattr(e, "response", None)) is not None
+            if breaker is not None and not loading:
+                breaker.record_failure()
+            attempt += 1
+            delay = policy.delay_for(e, attempt - 1)
+            if attempt >= policy.max_attempts or clock() - started + delay > policy.deadline:
+                raise
+            if on_retry is not None:
+                on_retry(e, delay)
+            sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+class RetryingClient:
+    """Wraps an InferenceClient so generation calls retry transient failures."""
+
+    def __init__(self, client, policy=None, breaker=None):
+        self.client = client
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+
+    def _call(self, method, kwargs):
+        model = kwargs.get("model") or ""
+
+        def on_retry(error, delay):
+            METRICS.inc("retries", model=model)
+
+        try:
+            return call_with_retry(
+                lambda: getattr(self.client, method)(**kwargs),
+                self.policy, self.breaker, on_retry=on_retry
+            )
+        except CircuitOpenError:
+            METRICS.inc("circuit_open_rejections", model=model)
+            raise
+
+    def text_to_image(self, **kwargs):
+        return self._call("text_to_image", kwargs)
+
+    def image_to_image(self, **kwargs):
+        return self._call("image_to_image", kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _retry_after(response):
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # HTTP-date form is rare for this API; fall back to backoff
+        return None
+
+
+def _estimated_load_time(response):
+    # A cold model answers 503 with {"error": "... is currently loading", "estimated_time": 20.0}
+    if response is None or getattr(response, "status_code", None) != 503:
+        return None
+    try:
+        body = json.loads(response.content)
+    except Exception:
+        # Unread stream or non-JSON body
+        return None
+    if isinstance(body, dict) and isinstance(body.get("estimated_time"), (int, float)):
+        return float(body["estimated_time"])
+    return None
@@ -0,0 +1,151 @@
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+from metrics import METRICS
+from previews import is_preview_request
+from rate_limit import QueueFullError
+from retry import CircuitOpenError, is_retryable
+
+# Only calls from the last few minutes count towards a backend's score
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+ROUTER_MAX_SAMPLES = 50
+# Backends failing more often than this are only tried after the healthy ones
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+
+# Answers meaning "this backend cannot serve the request", so another one should try
+FAILOVER_STATUS_CODES = {401, 403, 404}
+
+
+def should_fail_over(error):
+    if isinstance(error, (CircuitOpenError, QueueFullError)):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in FAILOVER_STATUS_CODES or is_retryable(error)
+
+
+class Backend:
+    """One inference backend plus its recent latency and error history.
+
+    models limits the model IDs the backend serves (None serves any);
+    previews marks backends that stream partial images themselves.
+    """
+
+    def __init__(self, name, client, models=None, image_to_image=True, previews=False,
+                 window=ROUTER_WINDOW_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.client = client
+        self.models = set(models) if models else None
+        self.image_to_image = image_to_image
+        self.previews = previews
+        self.window = window
+        self._clock = clock
+        self._calls = deque(maxlen=ROUTER_MAX_SAMPLES)  # (time, ok, seconds)
+        self._lock = threading.Lock()
+
+    def serves(self, method, model):
+        if method == "image_to_image" and not self.image_to_image:
+            return False
+        return self.models is None or model in self.models
+
+    def record(self, ok, seconds):
+        with self._lock:
+            self._calls.append((self._clock(), ok, seconds))
+
+    def _recent(self):
+        cutoff = self._clock() - self.window
+        with self._lock:
+            return [call for call in self._calls if call[0] >= cutoff]
+
+    def latency(self):
+        """Median seconds of recent successful calls, or None without any."""
+        latencies = [seconds for _, ok, seconds in self._recent() if ok]
+        return statistics.median(latencies) if latencies else None
+
+    def error_rate(self):
+        calls = self._recent()
+        if not calls:
+            return 0.0
+        return sum(1 for _, ok, _ in calls if not ok) / len(calls)
+
+    @property
+    def healthy(self):
+        breaker = getattr(self.client, "breaker", None)
+        if breaker is not None and breaker.is_open:
+            return False
+        return self.error_rate() <= ROUTER_MAX_ERROR_RATE
+
+    def score(self):
+        # Untried backends score 0 so they get measured first
+        latency = self.latency()
+        if latency is None:
+            return 0.0
+        return latency * (1 + 4 * self.error_rate())
+
+    def stats(self):
+        latency = self.latency()
+        return {
+            "backend": self.name,
+            "healthy": self.healthy,
+            "calls": len(self._recent()),
+            "p50_ms": round(latency * 1000, 1) if latency is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+class BackendRouter:
+    """Sends each generation call to the fastest healthy backend that serves
+    the model, failing over to the next one when a backend is unavailable."""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    def candidates(self, method, model):
+        """Backends able to serve the call, healthy ones first, fastest first."""
+        serving = [backend for backend in self.backends if backend.serves(method, model)]
+        return sorted(serving, key=lambda backend: (not backend.healthy, backend.score()))
+
+    def streams_previews(self, model):
+        """Whether the backend a text-to-image call for model would go to first streams previews."""
+        candidates = self.candidates("text_to_image", model)
+        return bool(candidates) and candidates[0].previews
+
+    def _call(self, method, kwargs):
+        model = kwargs.get("model") or ""
+        candidates = self.candidates(method, model)
+        if not candidates:
+            raise ValueError(f"No inference backend serves {method} for {model!r}")
+
+        # Quick preview requests would make a backend look faster than it is
+        measured = not is_preview_request()
+        for index, backend in enumerate(candidates):
+            if index:
+                METRICS.inc("failovers", model=model)
+            started = time.perf_counter()
+            try:
+                result = getattr(backend.client, method)(**kwargs)
+            except Exception as e:
+                if measured:
+                    backend.record(False, time.perf_counter() - started)
+                if not should_fail_over(e) or index == len(candidates) - 1:
+                    raise
+                continue
+            if measured:
+                seconds = time.perf_counter() - started
+                backend.record(True, seconds)
+                METRICS.observe(f"backend_{backend.name}", seconds, model)
+            return result
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+    def text_to_image(self, **kwargs):
+        return self._call("text_to_image", kwargs)
+
+    def image_to_image(self, **kwargs):
+        return self._call("image_to_image", kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.backends[0].client, name)
@@ -0,0 +1,298 @@
+"""State shared by several app replicas: result cache entries, job status
+and the rate-limit budget of the shared HUGGINGFACE_TOKEN.
+
+SHARED_STATE_URL selects the backend:
+
+    sqlite:///var/lib/imagegen/state.db   replicas on one host (SQLite file locking)
+    redis://127.0.0.1:6379/0              any Redis-protocol server
+
+Without it every replica keeps its own state, as before.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL")
+REDIS_TIMEOUT_SECONDS = float(os.getenv("SHARED_STATE_TIMEOUT_SECONDS", "5"))
+# After a failed command, calls fail at once for this long so callers use
+# their local fallback instead of each waiting for the timeout again
+REDIS_COOLDOWN_SECONDS = float(os.getenv("SHARED_STATE_COOLDOWN_SECONDS", "10"))
+
+
+class SQLiteStore:
+    """Key-value store and token buckets in one SQLite file.
+
+    Every replica on the host opens the same file; SQLite's file locks make
+    the token bucket update atomic across processes.
+    """
+
+    # Expired keys are purged every this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, expires))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    @staticmethod
+    def _tokens(row, rate, burst, now):
+        return float(burst) if row is None else min(burst, row[0] + (now - row[1]) * rate)
+
+    def acquire(self, name, rate, burst):
+        """Take a token from the named bucket. Returns 0, or seconds until the next token."""
+        # BEGIN IMMEDIATE takes the write lock, so the read-modify-write is atomic across processes
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = self._tokens(row, rate, burst, now)
+                taken = tokens >= 1
+                if taken:
+                    tokens -= 1
+                self._db.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return 0.0 if taken else (1 - tokens) / rate
+
+    def eta(self, name, rate, burst, count):
+        """Seconds until `count` tokens will have been available (read only)."""
+        with self._lock:
+            row = self._db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        return max(0.0, (count - self._tokens(row, rate, burst, time.time())) / rate)
+
+    def set_bounded(self, key, value, ttl, prefix, max_bytes):
+        """set() key, then drop the oldest `prefix` keys until they total at most max_bytes.
+
+        Freed pages are reused by later writes, so the file stops growing
+        at about max_bytes of values.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._db.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+                self._db.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                                 (key, value, now + ttl if ttl else None))
+                # Every key under the prefix has the same TTL, so later expiry means newer
+                rows = self._db.execute(
+                    "SELECT key, length(value) FROM kv WHERE substr(key, 1, ?) = ? ORDER BY expires DESC, rowid DESC",
+                    (len(prefix), prefix)
+                ).fetchall()
+                total = 0
+                evicted = []
+                for old_key, size in rows:
+                    total += size
+                    if total > max_bytes:
+                        evicted.append((old_key,))
+                self._db.executemany("DELETE FROM kv WHERE key = ?", evicted)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+
+class RedisError(Exception):
+    """Error reply from the Redis-protocol server."""
+
+
+class RedisStore:
+    """Key-value store and rate windows on a Redis-protocol server.
+
+    Speaks RESP directly over one socket and only uses GET, SET, DEL, INCR,
+    INCRBY, DECRBY, PEXPIRE, RPUSH and LPOP, so simple stand-ins work too. The token bucket is
+    approximated by fixed windows of burst / rate seconds holding `burst`
+    tokens each. After a connection failure, commands raise ConnectionError
+    without touching the network for `cooldown` seconds.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=REDIS_TIMEOUT_SECONDS,
+                 cooldown=REDIS_COOLDOWN_SECONDS):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._down_until = 0.0
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379,
+                   int(parsed.path.strip("/") or 0), parsed.password)
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", self.db)
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._file = None
+
+    def _send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the shared state server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length == -1 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def _check_cooldown(self):
+        remaining = self._down_until - time.monotonic()
+        if remaining > 0:
+            raise ConnectionError(f"Shared state server unavailable, retrying in {remaining:.0f}s")
+
+    def command(self, *args):
+        # Checked before and after waiting for the lock: callers queued behind
+        # a command that just failed give up too
+        self._check_cooldown()
+        with self._lock:
+            self._check_cooldown()
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except (ConnectionError, OSError):
+                    # Reconnect once after a dropped connection
+                    self._close()
+                    if attempt:
+                        self._down_until = time.monotonic() + self.cooldown
+                        raise
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self.command("SET", key, value)
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def set_bounded(self, key, value, ttl, prefix, max_bytes):
+        """set() key, then drop the oldest `prefix` keys until they total at most max_bytes.
+
+        Sizes are tracked in an insertion-ordered list and a byte counter
+        next to the keys; expired keys stay counted until evicted from the list.
+        A key that is already stored (another replica put the same result) is
+        left as is, so it is counted once.
+        """
+        expiry = ("PX", int(ttl * 1000)) if ttl else ()
+        if self.command("SET", key, value, *expiry, "NX") is None:
+            return
+        index, counter = prefix + "#index", prefix + "#bytes"
+        self.command("RPUSH", index, f"{len(value)} {key}")
+        total = self.command("INCRBY", counter, len(value))
+        while total > max_bytes:
+            entry = self.command("LPOP", index)
+            if entry is None:
+                break
+            size, _, old_key = entry.decode("utf-8").partition(" ")
+            self.command("DEL", old_key)
+            total = self.command("DECRBY", counter, int(size))
+
+    def _window(self, name, rate, burst):
+        length = burst / rate
+        index = int(time.time() // length)
+        return f"bucket:{name}:{index}", (index + 1) * length - time.time(), length
+
+    def acquire(self, name, rate, burst):
+        """Take a token from the named bucket. Returns 0, or seconds until the next window."""
+        key, remaining, length = self._window(name, rate, burst)
+        used = self.command("INCR", key)
+        if used == 1:
+            self.command("PEXPIRE", key, int(length * 1000) + 1000)
+        return 0.0 if used <= burst else remaining
+
+    def eta(self, name, rate, burst, count):
+        """Seconds until `count` more tokens will have been available."""
+        key, remaining, length = self._window(name, rate, burst)
+        available = burst - int(self.command("GET", key) or 0)
+        if count <= available:
+            return 0.0
+        return remaining + (count - available - 1) // burst * length
+
+
+def open_store(url):
+    """Open the shared state backend for url, or return None without one."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    scheme = parsed.scheme
+    if scheme == "sqlite":
+        # sqlite:///var/lib/state.db is an absolute path, sqlite://state.db a relative one
+        return SQLiteStore(parsed.netloc + parsed.path)
+    if scheme in ("redis", "resp"):
+        return RedisStore.from_url(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme {scheme!r}")
+
+
+SHARED_STATE = open_store(SHARED_STATE_URL)
+
@@ -0,0 +1,131 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from prompts import prompt_suffixes
+
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))
+SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "2000"))
+# Optional sentence-transformers model (e.g. all-MiniLM-L6-v2); TF-IDF is used without it
+SIMILARITY_EMBEDDING_MODEL = os.getenv("SIMILARITY_EMBEDDING_MODEL")
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def _suffixes():
+    return frozenset(prompt_suffixes().values())
+
+
+def split_prompt(prompt):
+    """Split an enhance_prompt result into (base prompt, style suffix).
+
+    The suffix is the boilerplate the UI appends; it has to match exactly,
+    so only the user's own words are compared for similarity.
+    """
+    start = prompt.find(", ")
+    while start != -1:
+        if prompt[start + 2:] in _suffixes():
+            return prompt[:start], prompt[start + 2:]
+        start = prompt.find(", ", start + 2)
+    return prompt, ""
+
+
+def normalize_prompt(text):
+    """Lower-cased words of a prompt, ignoring punctuation, spacing and accents."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WORD.findall(text)
+
+
+class SimilarityIndex:
+    """In-memory index of past text-to-image prompts for near-duplicate lookups.
+
+    Entries are grouped by exact request settings (model, size, negative
+    prompt and style suffix); within a group, base prompts are compared by
+    cosine similarity of TF-IDF vectors, or of sentence embeddings when
+    SIMILARITY_EMBEDDING_MODEL is set. Each entry points at a result cache key.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=SIMILARITY_MAX_ENTRIES,
+                 embedding_model=SIMILARITY_EMBEDDING_MODEL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedding_model = embedding_model
+        self._encoder = None
+        self._entries = OrderedDict()  # cache key -> (group, vector), oldest first
+        self._document_frequency = Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _embed(self, base_prompt):
+        if self.embedding_model:
+            if self._encoder is None:
+                # Imported lazily: loading the model takes seconds and most setups use TF-IDF
+                from sentence_transformers import SentenceTransformer
+                self._encoder = SentenceTransformer(self.embedding_model)
+            return self._encoder.encode(" ".join(normalize_prompt(base_prompt)), normalize_embeddings=True)
+        return Counter(normalize_prompt(base_prompt))
+
+    def _tfidf(self, counts):
+        total = len(self._entries) + 1
+        weights = {
+            term: count * (math.log(total / (1 + self._document_frequency[term])) + 1)
+            for term, count in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def _similarity(self, query, vector):
+        if self.embedding_model:
+            return float(query @ vector)
+        return sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+
+    def add(self, prompt, group, key):
+        """Remember that `prompt` with settings `group` produced cache entry `key`."""
+        base_prompt, suffix = split_prompt(prompt)
+        vector = self._embed(base_prompt)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = ((group, suffix), vector)
+            if not self.embedding_model:
+                self._document_frequency.update(vector.keys())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def lookup(self, prompt, group, threshold=None):
+        """Return (cache key, similarity) of the closest earlier prompt, or None
+        when nothing in the same group reaches the threshold."""
+        threshold = self.threshold if threshold is None else threshold
+        base_prompt, suffix = split_prompt(prompt)
+        query = self._embed(base_prompt)
+        best = None
+        with self._lock:
+            candidates = [(key, vector) for key, (entry_group, vector) in self._entries.items()
+                          if entry_group == (group, suffix)]
+            if not self.embedding_model:
+                query = self._tfidf(query)
+                candidates = [(key, self._tfidf(vector)) for key, vector in candidates]
+            for key, vector in candidates:
+                score = self._similarity(query, vector)
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+    def discard(self, key):
+        """Forget an entry whose cached result is gone."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, vector = self._entries.pop(key)
+        if not self.embedding_model:
+            self._document_frequency.subtract(vector.keys())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app is a set of flat modules; the fake servers live in benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
@@ -0,0 +1,85 @@
+import json
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image
+
+import gallery as gallery_module
+from export import build_history_zip, history_file_name
+from gallery import Gallery
+
+
+def png_bytes(color):
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_clear_keeps_recently_written_files(tmp_path):
+    gallery = Gallery(str(tmp_path))
+    mine = gallery.add(png_bytes("red"), prompt="mine", style="None", timestamp="10:00:00", session_id="a")
+
+    # Another replica is about to index the same image
+    gallery.clear("a")
+    assert gallery.thumbnail(mine) is not None
+
+
+def test_missing_files_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_module, "BLOB_GRACE_SECONDS", -1)
+    gallery = Gallery(str(tmp_path))
+    kept = gallery.add(png_bytes("blue"), prompt="kept", style="None", timestamp="10:00:00", session_id="b")
+    gone = gallery.add(png_bytes("red"), prompt="gone", style="None", timestamp="10:00:01", session_id="a")
+    # A row whose files were removed underneath it
+    dangling = dict(gone, id="dangling")
+    gallery.clear("a")
+
+    assert gallery.thumbnail(dangling) is None
+    assert gallery.image_bytes(dangling) is None
+    with zipfile.ZipFile(build_history_zip(gallery, [dangling, kept])) as zf:
+        assert [name for name in zf.namelist() if name.endswith(".png")] == [history_file_name(kept, 1)]
+
+
+def test_prune_drops_oldest_entries_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_module, "BLOB_GRACE_SECONDS", -1)
+    gallery = Gallery(str(tmp_path), max_bytes=0, max_age=0)
+    entries = [gallery.add(png_bytes(color), prompt=color, style="None", timestamp="10:00:00")
+               for color in ("red", "green", "blue")]
+    # The same image again shares the newest file
+    gallery.add(png_bytes("blue"), prompt="blue again", style="None", timestamp="10:00:00")
+
+    assert gallery.prune(max_bytes=entries[2]["size"]) == 2
+    assert [entry["prompt"] for entry in gallery.entries()] == ["blue again", "blue"]
+    assert gallery.image_bytes(entries[0]) is None
+    assert gallery.image_bytes(entries[2]) is not None
+
+
+def test_prune_by_age(tmp_path):
+    gallery = Gallery(str(tmp_path), max_bytes=0, max_age=0)
+    gallery.add(png_bytes("red"), prompt="red", style="None", timestamp="10:00:00")
+
+    assert gallery.prune(max_age=3600) == 0
+    assert gallery.prune(max_age=-1) == 1
+    assert gallery.count() == 0
+
+
+def test_queries_can_be_limited_to_one_session(tmp_path):
+    gallery = Gallery(str(tmp_path))
+    gallery.add(png_bytes("red"), prompt="red cat", style="None", timestamp="10:00:00", session_id="a")
+    gallery.add(png_bytes("blue"), prompt="blue cat", style="None", timestamp="10:00:01", session_id="b")
+
+    assert gallery.count() == 2
+    assert gallery.count("cat", session_id="a") == 1
+    assert [entry["prompt"] for entry in gallery.entries("cat", session_id="b")] == ["blue cat"]
+    assert gallery.page(session_id="c") == ([], 0)
+
+
+def test_export_names_and_manifest_carry_the_full_date(tmp_path):
+    gallery = Gallery(str(tmp_path))
+    entry = gallery.add(png_bytes("red"), prompt="red", style="None", timestamp="10:00:00")
+    created = datetime.fromtimestamp(entry["created"]).astimezone()
+
+    with zipfile.ZipFile(build_history_zip(gallery, [entry])) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+    assert manifest[0]["file"] == f"ai_generated_{created:%Y%m%dT%H%M%S}_0.png"
+    assert datetime.fromisoformat(manifest[0]["created"]) == created.replace(microsecond=0)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager
+from rate_limit import QueueFullError
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class BlockingJobs:
+    """Jobs that record when they start and block until released."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = []
+        self.running = {}
+        self.most_running = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, job, name, session_id=None):
+        with self._lock:
+            self.started.append(name)
+            self.running[session_id] = self.running.get(session_id, 0) + 1
+            self.most_running[session_id] = max(self.most_running.get(session_id, 0), self.running[session_id])
+        self.gate.wait()
+        with self._lock:
+            self.running[session_id] -= 1
+        return name
+
+
+def test_sessions_take_turns_for_a_free_worker():
+    jobs = BlockingJobs()
+    manager = JobManager(max_workers=1, shared=None, max_per_session=1)
+    # Holds the only worker while both sessions queue up
+    manager.submit(jobs, "blocker", session_id="x")
+    wait_until(lambda: jobs.started == ["blocker"])
+    ids = [manager.submit(jobs, name, session_id="a") for name in ("a1", "a2", "a3")]
+    ids += [manager.submit(jobs, name, session_id="b") for name in ("b1", "b2")]
+
+    assert manager.get(ids[0]).message == "#1 in queue"
+    assert manager.get(ids[3]).message == "#2 in queue"
+
+    jobs.gate.set()
+    wait_until(lambda: all(manager.get(job_id).is_finished for job_id in ids))
+    assert jobs.started == ["blocker", "a1", "b1", "a2", "b2", "a3"]
+
+
+def test_one_session_cannot_take_every_worker():
+    jobs = BlockingJobs()
+    manager = JobManager(max_workers=4, shared=None, max_per_session=2)
+    ids = [manager.submit(jobs, f"a{index}", session_id="a") for index in range(4)]
+    ids.append(manager.submit(jobs, "b0", session_id="b"))
+
+    # Two of a's jobs and b's job run; a's other two wait despite a free worker
+    wait_until(lambda: len(jobs.started) == 3)
+    time.sleep(0.05)
+    assert sorted(jobs.started) == ["a0", "a1", "b0"]
+    assert manager.stats()["queued"] == 2
+
+    jobs.gate.set()
+    wait_until(lambda: all(manager.get(job_id).is_finished for job_id in ids))
+    assert jobs.most_running == {"a": 2, "b": 1}
+
+
+def test_submit_raises_when_the_queue_is_full():
+    jobs = BlockingJobs()
+    manager = JobManager(max_workers=1, shared=None, max_per_session=1, max_queued=3, max_queued_per_session=2)
+    manager.submit(jobs, "running", session_id="a")
+    wait_until(lambda: jobs.started == ["running"])
+    manager.submit(jobs, "a1", session_id="a")
+    manager.submit(jobs, "a2", session_id="a")
+
+    with pytest.raises(QueueFullError):
+        manager.submit(jobs, "a3", session_id="a")
+    manager.submit(jobs, "b1", session_id="b")
+    with pytest.raises(QueueFullError):
+        manager.submit(jobs, "b2", session_id="b")
+    jobs.gate.set()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from rate_limit import AdmissionQueue, QueueFullError
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class ManualBucket:
+    """Token bucket that only hands out tokens the test adds."""
+
+    def __init__(self):
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.tokens += 1
+
+    def try_acquire(self):
+        with self._lock:
+            if self.tokens:
+                self.tokens -= 1
+                return 0.0
+            return 0.01
+
+    def eta(self, count):
+        return 0.0
+
+
+def test_sessions_are_admitted_round_by_round():
+    bucket = ManualBucket()
+    queue = AdmissionQueue(bucket, poll_interval=0.01)
+    admitted = []
+
+    def request(name, session_id):
+        queue.admit(session_id)
+        admitted.append(name)
+
+    # A batch from session a, then two requests from session b
+    for count, (name, session_id) in enumerate([("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("b2", "b")], 1):
+        threading.Thread(target=request, args=(name, session_id), daemon=True).start()
+        wait_until(lambda: len(queue) == count)
+
+    for count in range(1, 6):
+        bucket.add()
+        wait_until(lambda: len(admitted) == count)
+    assert admitted == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_reports_position_while_waiting():
+    bucket = ManualBucket()
+    queue = AdmissionQueue(bucket, poll_interval=0.01)
+    positions = []
+    threading.Thread(target=queue.admit, args=("a",), daemon=True).start()
+    wait_until(lambda: len(queue) == 1)
+    thread = threading.Thread(target=queue.admit, args=("b", lambda position, eta: positions.append(position)))
+    thread.start()
+    wait_until(lambda: 2 in positions)
+
+    bucket.add()
+    bucket.add()
+    thread.join(5)
+    assert positions[-1] == 0
+
+
+def test_rejects_requests_when_full():
+    bucket = ManualBucket()
+    queue = AdmissionQueue(bucket, max_waiting=2, poll_interval=0.01)
+    for count in (1, 2):
+        threading.Thread(target=queue.admit, args=("a",), daemon=True).start()
+        wait_until(lambda: len(queue) == count)
+
+    with pytest.raises(QueueFullError):
+        queue.admit("b")
+    bucket.add()
+    bucket.add()
+    wait_until(lambda: len(queue) == 0)
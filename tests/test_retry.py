@@ -0,0 +1,110 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from inference import make_backend
+from retry import CircuitBreaker, CircuitOpenError, RetryingClient, RetryPolicy, call_with_retry
+from stub_server import StubInferenceServer
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None, body=None):
+        super().__init__(f"HTTP {status}")
+        self.response = SimpleNamespace(
+            status_code=status, headers=headers or {}, content=json.dumps(body or {}).encode("utf-8")
+        )
+
+
+class FakeClock:
+    """Clock and sleep that only move when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def failing_then(errors, result="ok"):
+    errors = list(errors)
+
+    def func():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func
+
+
+def test_honours_retry_after():
+    clock = FakeClock()
+    func = failing_then([HTTPError(429, headers={"Retry-After": "3"})])
+
+    assert call_with_retry(func, RetryPolicy(max_attempts=3), sleep=clock.sleep, clock=clock) == "ok"
+    assert clock.sleeps == [3.0]
+
+
+def test_waits_estimated_time_for_loading_model():
+    clock = FakeClock()
+    func = failing_then([HTTPError(503, body={"error": "loading", "estimated_time": 7.5})])
+
+    assert call_with_retry(func, RetryPolicy(max_attempts=3), sleep=clock.sleep, clock=clock) == "ok"
+    assert clock.sleeps == [7.5]
+
+
+def test_estimated_time_is_capped_by_max_load_wait():
+    clock = FakeClock()
+    func = failing_then([HTTPError(503, body={"estimated_time": 300})])
+
+    call_with_retry(func, RetryPolicy(max_attempts=3, max_load_wait=20), sleep=clock.sleep, clock=clock)
+    assert clock.sleeps == [20]
+
+
+def test_gives_up_when_the_wait_would_pass_the_deadline():
+    clock = FakeClock()
+    func = failing_then([HTTPError(429, headers={"Retry-After": "4"})] * 5)
+
+    with pytest.raises(HTTPError):
+        call_with_retry(func, RetryPolicy(max_attempts=10, deadline=10), sleep=clock.sleep, clock=clock)
+    # Waits 4 s twice; a third wait would end after the 10 s deadline
+    assert clock.sleeps == [4.0, 4.0]
+
+
+def test_does_not_retry_client_errors():
+    clock = FakeClock()
+    func = failing_then([HTTPError(400)])
+
+    with pytest.raises(HTTPError):
+        call_with_retry(func, RetryPolicy(max_attempts=5), sleep=clock.sleep, clock=clock)
+    assert clock.sleeps == []
+
+
+def test_breaker_opens_after_repeated_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    func = failing_then([HTTPError(500, headers={"Retry-After": "1"})] * 5)
+
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(func, RetryPolicy(max_attempts=5), breaker, sleep=clock.sleep, clock=clock)
+    assert breaker.is_open
+
+
+def test_retrying_client_rides_out_loading_and_rate_limits():
+    stub = StubInferenceServer(latency=0.0, jitter=0.0, statuses=[503, 429, 200]).start()
+    try:
+        spec = {"name": "stub", "kind": "endpoint", "url": stub.url, "rate_per_minute": 6000}
+        client = make_backend(spec, token=None, policy=RetryPolicy(max_attempts=3)).client
+        assert isinstance(client, RetryingClient)
+
+        image = client.text_to_image(prompt="a cat", model="test-model", width=64, height=64)
+    finally:
+        stub.stop()
+
+    assert image.size == (64, 64)
+    assert (stub.requests, stub.errors) == (3, 2)
+    assert not client.breaker.is_open
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from inference import make_backend
+from retry import RetryPolicy
+from router import Backend, BackendRouter, should_fail_over
+from stub_server import StubInferenceServer
+
+
+@pytest.fixture
+def stubs():
+    failing = StubInferenceServer(latency=0.0, jitter=0.0, error_rate=1.0).start()
+    healthy = StubInferenceServer(latency=0.0, jitter=0.0, error_rate=0.0).start()
+    yield failing, healthy
+    failing.stop()
+    healthy.stop()
+
+
+def openai_backend(name, url):
+    # Own admission budget, and a single attempt so failures fail over right away
+    spec = {"name": name, "kind": "openai", "url": url, "rate_per_minute": 6000}
+    return make_backend(spec, token=None, policy=RetryPolicy(max_attempts=1))
+
+
+class FakeClient:
+    def __init__(self, name):
+        self.name = name
+
+    def text_to_image(self, **kwargs):
+        return self.name
+
+
+def test_fails_over_from_failing_backend_to_healthy_one(stubs):
+    failing, healthy = stubs
+    router = BackendRouter([openai_backend("failing", failing.url), openai_backend("healthy", healthy.url)])
+
+    image = router.text_to_image(prompt="a cat", model="test-model", width=64, height=64)
+
+    assert image.size == (64, 64)
+    assert failing.requests == 1
+    assert healthy.requests == 1
+    assert router.backends[0].error_rate() == 1.0
+
+
+def test_unhealthy_backend_sorts_last():
+    now = [0.0]
+    fast = Backend("fast", FakeClient("fast"), clock=lambda: now[0])
+    slow = Backend("slow", FakeClient("slow"), clock=lambda: now[0])
+    fast.record(True, 0.1)
+    for _ in range(3):
+        fast.record(False, 0.1)
+    slow.record(True, 2.0)
+    router = BackendRouter([fast, slow])
+
+    assert not fast.healthy
+    assert [backend.name for backend in router.candidates("text_to_image", "m")] == ["slow", "fast"]
+    assert router.text_to_image(prompt="p", model="m") == "slow"
+
+
+def test_backends_not_serving_the_call_are_skipped():
+    text_only = Backend("text-only", FakeClient("text-only"), image_to_image=False)
+    other_model = Backend("other", FakeClient("other"), models=["other/model"])
+    router = BackendRouter([text_only, other_model])
+
+    assert router.candidates("image_to_image", "some/model") == []
+    with pytest.raises(ValueError):
+        router.image_to_image(prompt="p", model="some/model")
+
+
+@pytest.mark.parametrize("status, expected", [(401, True), (404, True), (503, True), (429, True), (400, False)])
+def test_should_fail_over_by_status(status, expected):
+    error = Exception(f"HTTP {status}")
+    error.response = SimpleNamespace(status_code=status)
+    assert should_fail_over(error) is expected
@@ -0,0 +1,63 @@
+import socket
+
+import pytest
+
+import resp_server
+from result_cache import ResultCache, SharedResultCache
+from shared_state import RedisStore, SQLiteStore
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        yield SQLiteStore(str(tmp_path / "state.db"))
+        return
+    server = resp_server.start(port=0)
+    yield RedisStore("127.0.0.1", server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_shared_results_are_capped_oldest_first(store, tmp_path):
+    cache = SharedResultCache(ResultCache(str(tmp_path / "local")), store, ttl=60, max_bytes=3000)
+    for index in range(10):
+        cache.put(f"key{index}", bytes([index]) * 1000)
+
+    kept = [index for index in range(10) if store.get(f"result:key{index}") is not None]
+    assert kept == [7, 8, 9]
+
+
+def test_eta_does_not_take_tokens(store):
+    # A slow refill keeps Redis' fixed window from rolling over mid-test
+    assert store.eta("bucket", 0.01, 2, 2) == 0.0
+    assert store.eta("bucket", 0.01, 2, 2) == 0.0
+    assert store.acquire("bucket", 0.01, 2) == 0.0
+    assert store.acquire("bucket", 0.01, 2) == 0.0
+    assert store.acquire("bucket", 0.01, 2) > 0
+
+
+def test_putting_the_same_result_twice_counts_it_once(store, tmp_path):
+    # Two replicas finishing the same request store the same key
+    caches = [SharedResultCache(ResultCache(str(tmp_path / name)), store, ttl=60, max_bytes=3000)
+              for name in ("one", "two")]
+    caches[0].put("key0", b"0" * 1000)
+    caches[1].put("key0", b"0" * 1000)
+    caches[0].put("key1", b"1" * 1000)
+    caches[1].put("key2", b"2" * 1000)
+
+    assert all(store.get(f"result:key{index}") is not None for index in range(3))
+
+
+def test_redis_fails_fast_after_a_connection_error():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    store = RedisStore("127.0.0.1", port, timeout=1, cooldown=60)
+    with pytest.raises(OSError):
+        store.get("key")
+
+    connects = []
+    store._connect = lambda: connects.append(1)
+    with pytest.raises(ConnectionError, match="unavailable"):
+        store.get("key")
+    assert connects == []
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def run_concurrently(flight, key, func, callers):
+    """Start a leader blocked in func, then `callers` more for the same key."""
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, func))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    wait_until(lambda: flight.stats()["in_flight"] == 1)
+    for _ in range(callers):
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+    wait_until(lambda: flight.stats()["coalesced"] == callers)
+    return threads, results
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    gate = threading.Event()
+    runs = []
+
+    def func():
+        runs.append(1)
+        gate.wait()
+        return "image"
+
+    threads, results = run_concurrently(flight, "key", func, callers=3)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(runs) == 1
+    assert sorted(results) == [("image", False)] + [("image", True)] * 3
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_waiting_callers_get_the_leaders_error():
+    flight = SingleFlight()
+    gate = threading.Event()
+
+    def func():
+        gate.wait()
+        raise ValueError("backend failed")
+
+    threads, results = run_concurrently(flight, "key", func, callers=2)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_later_and_different_keys_run_again():
+    flight = SingleFlight()
+
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("a", lambda: 2) == (2, False)
+    assert flight.do("b", lambda: 3) == (3, False)
+    assert flight.stats()["coalesced"] == 0